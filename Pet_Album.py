@@ -1,5 +1,11 @@
+import argparse
+import csv
+import json
+import os
 import random
 import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 
 def print_progress(iteration, total, prefix='', suffix='', length=50, fill='█'):
     """
@@ -120,8 +126,11 @@ def get_pet_info():
 
     return pet_info
 
-def generate_album_content(pet_info):
+def generate_album_content(pet_info, rng=None):
     """Generates the album content based on the pet's info using a detailed mapping plan."""
+    # Pass a seeded random.Random for reproducible output; defaults to the global RNG
+    if rng is None:
+        rng = random
 
     track_list = []
     easter_eggs = []
@@ -147,7 +156,7 @@ def generate_album_content(pet_info):
         'Bossy': ("Command Performance", "Rules of the House (Remix)", "Schedule Keeper"),
         'Wise Sage': ("Ancient Sunbeam", "Oracle of the Couch", "Whisker Wisdom")
     }
-    opener_track = random.choice(vibe_map.get(vibe, ["Pet Anthem"]))
+    opener_track = rng.choice(vibe_map.get(vibe, ["Pet Anthem"]))
 
     # Energy
     energy_map = {
@@ -155,7 +164,7 @@ def generate_album_content(pet_info):
         'Balanced': ("Afternoon Zoom", "Gentle Pounce", "Window Patrol"),
         'Zoomies Every Hour': ("Midnight Zoomies", "Carpet Sprint", "Turbo Paw")
     }
-    energy_track = random.choice(energy_map.get(energy, ["Energy Flow"]))
+    energy_track = rng.choice(energy_map.get(energy, ["Energy Flow"]))
 
     # Play/Hobby
     activity = pet_info.get('favorite_activity')
@@ -167,7 +176,7 @@ def generate_album_content(pet_info):
         'Bird TV': ("Feather Channel", "Window Gazette"),
         'Box forts': ("Cardboard Citadel", "Corrugated Dreams")
     }
-    hobby_track = random.choice(activity_map.get(activity, ["Playtime"]))
+    hobby_track = rng.choice(activity_map.get(activity, ["Playtime"]))
 
     # Quirk/Signature Move
     move = pet_info.get('signature_move')
@@ -179,7 +188,7 @@ def generate_album_content(pet_info):
         'Spooky stare': ("Midnight Stare", "Ghost Lamp"),
         'Bread loaf': ("Loaf Mode", "Yeasty Rest")
     }
-    quirk_track = random.choice(move_map.get(move, ["Signature Move"]))
+    quirk_track = rng.choice(move_map.get(move, ["Signature Move"]))
 
     # Communication/Favorite Sound
     sound = pet_info.get('favorite_sound')
@@ -189,7 +198,7 @@ def generate_album_content(pet_info):
         'Snorts/bleps': ("Blep Etude", "Snort Groove"),
         'Dramatic sighs': ("Sigh Sonata", "Long Exhale")
     }
-    sound_track = random.choice(sound_map.get(sound, ["Pet Sounds"]))
+    sound_track = rng.choice(sound_map.get(sound, ["Pet Sounds"]))
 
     # Affection/Cuddle Ballad
     cuddle = pet_info.get('cuddle_factor')
@@ -198,7 +207,7 @@ def generate_album_content(pet_info):
         'Sometimes': ("Occasional Warmth", "Half-Blanket Waltz"),
         'Velcro': ("Stuck Like Fur", "Velcro Ballad")
     }
-    affection_track = random.choice(cuddle_map.get(cuddle, ["Cuddle Song"]))
+    affection_track = rng.choice(cuddle_map.get(cuddle, ["Cuddle Song"]))
 
     # Finale/Anthem
     sneakiness = pet_info.get('sneakiness')
@@ -207,14 +216,14 @@ def generate_album_content(pet_info):
         'Occasional heist': ("Minor Caper", "Sneak Peek"),
         'Master thief': ("Grand Heist", "Midnight Mission")
     }
-    finale_track = random.choice(sneakiness_map.get(sneakiness, ["Finale"]))
+    finale_track = rng.choice(sneakiness_map.get(sneakiness, ["Finale"]))
 
     # --- Assembly Logic ---
     track_list.append(f"1. {opener_track}")
     track_list.append(f"2. {energy_track}")
     
     mid_tracks = [hobby_track, quirk_track, sound_track]
-    random.shuffle(mid_tracks)
+    rng.shuffle(mid_tracks)
     
     track_number = 3
     for track in mid_tracks:
@@ -226,14 +235,14 @@ def generate_album_content(pet_info):
     if vibe == 'Goofball':
         habit = pet_info.get('weirdest_habit')
         if habit == 'Vocal monologues':
-             track_list.insert(random.randint(2, 4), f"{track_number}. Soliloquy at Dusk (Skit)")
+             track_list.insert(rng.randint(2, 4), f"{track_number}. Soliloquy at Dusk (Skit)")
         else:
-             track_list.insert(random.randint(2, 4), f"{track_number}. Goofball Interlude (Remix)")
+             track_list.insert(rng.randint(2, 4), f"{track_number}. Goofball Interlude (Remix)")
         has_interlude = True
         track_number += 1
 
     if pet_info.get('vocalness_description') == 'Opera' and not has_interlude:
-        track_list.insert(random.randint(2, 4), f"{track_number}. Vocal Solo (Interlude)")
+        track_list.insert(rng.randint(2, 4), f"{track_number}. Vocal Solo (Interlude)")
         has_interlude = True
         track_number += 1
 
@@ -245,7 +254,7 @@ def generate_album_content(pet_info):
     while len(track_list) < track_count:
         track_list.insert(-2, f"{len(track_list)}. Bonus Track")
     while len(track_list) > track_count:
-        track_list.pop(random.randint(2, len(track_list) - 3))
+        track_list.pop(rng.randint(2, len(track_list) - 3))
 
     # Renumber tracks after all adjustments
     final_numbered_tracks = []
@@ -259,7 +268,133 @@ def generate_album_content(pet_info):
 
     return {"track_list": final_numbered_tracks, "easter_eggs": easter_eggs}
 
+# --- Batch mode -------------------------------------------------------------
+# python Pet_Album.py --batch pets.csv --workers 8 --out covers/
+# Records stream from CSV or JSONL (one pet per row/line, same field names as
+# the web form, optional "id" and "photo" columns) and only a bounded window of
+# renders is in flight, so memory stays flat however long the input is.
+
+def count_records(path):
+    """Count records for the progress bar without loading the file."""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if path.lower().endswith('.csv'):
+            return max(0, sum(1 for _ in csv.reader(f)) - 1)
+        return sum(1 for line in f if line.strip())
+
+def iter_records(path):
+    """Yield (index, record) pairs from a CSV or JSONL file, one at a time."""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if path.lower().endswith('.csv'):
+            for index, row in enumerate(csv.DictReader(f)):
+                yield index, {k: v for k, v in row.items() if k and v not in (None, '')}
+        else:
+            index = 0
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    record = {'_error': f"invalid JSON: {e}"}
+                yield index, record
+                index += 1
+
+def _init_batch_worker():
+    import app
+    app._init_render_worker((1024,))
+
+def render_record(index, record, out_dir, base_dir):
+    """Build the album texts and poster for one record; returns a summary row."""
+    import app
+    from werkzeug.utils import secure_filename
+    row = {'index': index, 'id': record.get('id', index), 'status': 'ok', 'file': '', 'text_ms': '', 'render_ms': '', 'error': ''}
+    try:
+        if '_error' in record:
+            raise ValueError(record['_error'])
+        t0 = time.perf_counter()
+        answers = {k: str(v) for k, v in record.items() if k not in ('id', 'photo') and v is not None}
+        pet_info, content = app.build_album(answers)
+        t1 = time.perf_counter()
+        photo = record.get('photo')
+        photo_path = os.path.join(base_dir, photo) if photo else None
+        if photo_path and not os.path.isfile(photo_path):
+            raise FileNotFoundError(f"photo not found: {photo}")
+        label = secure_filename(str(record['id'])) if 'id' in record else ''
+        filename = f"{index:06d}_{label or 'cover'}.jpg"
+        app.generate_cover_image(pet_info, photo_path, tracks=content.get('track_list'), out_dir=out_dir, filename=filename)
+        t2 = time.perf_counter()
+        row.update(file=filename, text_ms=round((t1 - t0) * 1000, 1), render_ms=round((t2 - t1) * 1000, 1))
+    except Exception as e:
+        row.update(status='error', error=str(e))
+    return row
+
+SUMMARY_FIELDS = ['index', 'id', 'status', 'file', 'text_ms', 'render_ms', 'error']
+
+def run_batch(path, out_dir, workers=None, summary_path=None):
+    """Render every record in path into out_dir; returns (ok, failed)."""
+    os.makedirs(out_dir, exist_ok=True)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    summary_path = summary_path or os.path.join(out_dir, 'summary.csv')
+    workers = workers or os.cpu_count() or 1
+    total = count_records(path)
+    done = ok = 0
+    render_times = []
+    started = time.perf_counter()
+
+    with open(summary_path, 'w', encoding='utf-8', newline='') as summary, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker) as pool:
+        writer = csv.DictWriter(summary, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        pending = set()
+
+        def drain(block_until):
+            nonlocal pending, done, ok
+            while len(pending) > block_until:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    row = future.result()
+                    writer.writerow(row)
+                    done += 1
+                    if row['status'] == 'ok':
+                        ok += 1
+                        render_times.append(row['render_ms'])
+                    print_progress(done, max(total, done), prefix='Rendering:', suffix=f'{done}/{total}', length=50)
+
+        if total:
+            print_progress(0, total, prefix='Rendering:', suffix=f'0/{total}', length=50)
+        for index, record in iter_records(path):
+            # Keep a small window in flight so the input is never read ahead
+            drain(workers * 2 - 1)
+            pending.add(pool.submit(render_record, index, record, out_dir, base_dir))
+        drain(0)
+
+    elapsed = time.perf_counter() - started
+    print(f"\n\nRendered {ok}/{done} posters in {elapsed:.1f}s ({done / elapsed if elapsed else 0:.1f}/s) -> {out_dir}")
+    if render_times:
+        render_times.sort()
+        p50 = render_times[len(render_times) // 2]
+        p95 = render_times[min(len(render_times) - 1, int(len(render_times) * 0.95))]
+        print(f"Render time per poster: p50 {p50:.0f} ms, p95 {p95:.0f} ms, max {render_times[-1]:.0f} ms")
+    if done - ok:
+        print(f"{done - ok} record(s) failed; see {summary_path}")
+    else:
+        print(f"Per-item timings: {summary_path}")
+    return ok, done - ok
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Create a rockstar album for your pet, interactively or in batch.")
+    parser.add_argument('--batch', metavar='FILE', help="CSV or JSONL file of pet records to render without prompting")
+    parser.add_argument('--workers', type=int, default=None, help="parallel render processes (default: CPU count)")
+    parser.add_argument('--out', default=os.path.join('static', 'generated', 'batch'), help="directory for posters (default: %(default)s)")
+    parser.add_argument('--summary', default=None, help="per-item timing CSV (default: <out>/summary.csv)")
+    return parser.parse_args(argv)
+
 if __name__ == '__main__':
+    args = parse_args()
+    if args.batch:
+        ok, failed = run_batch(args.batch, args.out, workers=args.workers, summary_path=args.summary)
+        sys.exit(1 if failed else 0)
+
     album_data = get_pet_info()
     
     # Generate and display the creative content
@@ -1,10 +1,46 @@
-from flask import Flask, render_template, request, url_for
+from flask import Flask, Response, abort, has_request_context, jsonify, redirect, render_template, request, send_file, stream_with_context, url_for
 from werkzeug.utils import secure_filename
-from PIL import Image, ImageDraw, ImageFont, ImageFilter, ImageOps, ImageEnhance
+from PIL import Image, ImageDraw, ImageFont, ImageFilter, ImageOps, ImageEnhance, ImageStat
 import os
 import sys
 import random
 import time
+import contextlib
+import atexit
+import copy
+import cProfile
+import functools
+import hashlib
+import io
+import json
+import mimetypes
+import multiprocessing
+import queue
+import shutil
+import struct
+import threading
+import uuid
+import wave
+import weakref
+import zipfile
+import zlib
+from collections import Counter, OrderedDict
+from urllib.parse import quote
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
+# numpy is optional (palette extraction falls back to a pure-Pillow histogram) and
+# by far the slowest import, so _numpy() loads it on first use (or in warm_up())
+_np = False
+
+def _numpy():
+    global _np
+    if _np is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _np = numpy
+    return _np
 
 # Assuming the functions from Pet_Album.py are moved here or imported
 # For simplicity, I'll include the necessary functions directly in this file.
@@ -22,55 +58,1019 @@ os.makedirs(AUDIO_DIR, exist_ok=True)
 
 ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp'}
 
+# --- Metrics ----------------------------------------------------------------
+# Counters and histograms for /metrics (Prometheus text format). Updates go to
+# one of METRIC_SHARDS shards picked by thread id, so concurrent threads rarely
+# wait on the same lock; a scrape sums the shards.
+# With METRICS_DIR set, every process (web workers, render workers) also
+# writes its totals to METRICS_DIR/metrics-<pid>.json every
+# METRICS_SNAPSHOT_INTERVAL seconds and /metrics adds up all snapshots. Clear
+# the directory when the service is (re)deployed.
+METRICS_ENABLED = os.environ.get('METRICS', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+METRICS_DIR = os.environ.get('METRICS_DIR', '').strip()
+METRICS_SNAPSHOT_INTERVAL = float(os.environ.get('METRICS_SNAPSHOT_INTERVAL', '5'))
+METRICS_PREFIX = 'rockstar_pet_'
+
+# Histogram bucket upper bounds in seconds, shared by request and stage latencies
+TIMING_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC_BUCKETS = {
+    'upload_bytes': (64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 16 * 1024 ** 2, 64 * 1024 ** 2),
+}
+METRIC_HELP = {
+    'http_requests_total': 'Requests by endpoint, method and status.',
+    'http_request_duration_seconds': 'Request latency by endpoint, streamed bodies included.',
+    'render_stage_seconds': 'Time per poster pipeline stage, per request or render job.',
+    'render_jobs_total': 'Finished render queue jobs by status.',
+    'render_queue_depth': 'Render jobs waiting in the queue.',
+    'render_queue_capacity': 'Render queue size limit (RENDER_QUEUE_DEPTH).',
+    'render_jobs_running': 'Render jobs being rendered right now.',
+    'render_queue_rejected_total': 'Renders refused because the queue was full.',
+    'cache_hits_total': 'Cache hits by cache (font, mask, layout, render).',
+    'cache_misses_total': 'Cache misses by cache (font, mask, layout, render).',
+    'storage_bytes_written_total': 'Bytes written to storage by bucket (uploads, generated).',
+    'upload_bytes': 'Size of stored photo uploads.',
+    'missing_audio_total': 'Track previews whose audio file is missing, by audio id.',
+}
+
+METRIC_SHARDS = 16
+_metric_shards = tuple({'lock': threading.Lock(), 'counters': {}, 'histograms': {}} for _ in range(METRIC_SHARDS))
+
+def _metric_shard():
+    # The OS thread id, not get_ident(): pthread idents are aligned addresses
+    return _metric_shards[threading.get_native_id() % METRIC_SHARDS]
+
+def inc_metric(name, value=1, **labels):
+    """Add value to the counter name{labels}."""
+    if not METRICS_ENABLED:
+        return
+    shard = _metric_shard()
+    key = (name, tuple(sorted(labels.items())))
+    with shard['lock']:
+        counters = shard['counters']
+        counters[key] = counters.get(key, 0) + value
+
+def observe_metric(name, value, **labels):
+    """Record value in the histogram name{labels}."""
+    if not METRICS_ENABLED:
+        return
+    shard = _metric_shard()
+    key = (name, tuple(sorted(labels.items())))
+    bounds = METRIC_BUCKETS.get(name, TIMING_BUCKETS)
+    with shard['lock']:
+        hist = shard['histograms'].get(key)
+        if hist is None:
+            hist = shard['histograms'][key] = [[0] * len(bounds), 0.0, 0]
+        for i, bound in enumerate(bounds):
+            if value <= bound:
+                hist[0][i] += 1
+                break
+        hist[1] += value
+        hist[2] += 1
+
+def _cache_info_counters():
+    # lru_cache statistics, reported as hit/miss counters per process
+    out = {}
+    for cache, fn in (('font', _cached_font), ('mask', _vignette_masks), ('layout', _layout_cover_cached)):
+        info = fn.cache_info()
+        out[('cache_hits_total', (('cache', cache),))] = info.hits
+        out[('cache_misses_total', (('cache', cache),))] = info.misses
+    return out
+
+def _local_metrics():
+    """This process's counters and histograms: ({key: value}, {key: [buckets, sum, count]})."""
+    counters, histograms = _cache_info_counters(), {}
+    for shard in _metric_shards:
+        with shard['lock']:
+            shard_counters = list(shard['counters'].items())
+            shard_histograms = [(key, (list(hist[0]), hist[1], hist[2])) for key, hist in shard['histograms'].items()]
+        for key, value in shard_counters:
+            counters[key] = counters.get(key, 0) + value
+        for key, (buckets, total, count) in shard_histograms:
+            merged = histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+            merged[1] += total
+            merged[2] += count
+    return counters, histograms
+
+def write_metrics_snapshot():
+    """Write this process's totals to METRICS_DIR (no-op without it)."""
+    if not METRICS_DIR:
+        return
+    counters, histograms = _local_metrics()
+    data = {
+        'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+        'histograms': [[name, list(labels)] + hist for (name, labels), hist in histograms.items()],
+    }
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = os.path.join(METRICS_DIR, f"metrics-{os.getpid()}.json")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def _metrics_snapshot_loop():
+    while True:
+        time.sleep(METRICS_SNAPSHOT_INTERVAL)
+        try:
+            write_metrics_snapshot()
+        except OSError as e:
+            app.logger.warning("Could not write metrics snapshot: %s", e)
+
+def start_metrics_snapshots():
+    threading.Thread(target=_metrics_snapshot_loop, name='metrics-snapshot', daemon=True).start()
+    atexit.register(write_metrics_snapshot)
+
+def collect_metrics():
+    """Counters and histograms of this process plus, with METRICS_DIR, every other process's snapshot."""
+    counters, histograms = _local_metrics()
+    if not METRICS_DIR or not os.path.isdir(METRICS_DIR):
+        return counters, histograms
+    own = f"metrics-{os.getpid()}.json"
+    for entry in os.scandir(METRICS_DIR):
+        if entry.name == own or not entry.name.endswith('.json'):
+            continue
+        try:
+            with open(entry.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, labels, value in data.get('counters', []):
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, buckets, total, count in data.get('histograms', []):
+            key = (name, tuple(tuple(pair) for pair in labels))
+            merged = histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+            merged[1] += total
+            merged[2] += count
+    return counters, histograms
+
+def _metric_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+def format_metrics(counters, histograms, gauges=None):
+    """Render samples in the Prometheus text exposition format."""
+    families = {}
+    for (name, labels), value in sorted(counters.items()):
+        families.setdefault((name, 'counter'), []).append(f"{METRICS_PREFIX}{name}{_metric_labels(labels)} {value}")
+    for (name, labels), value in sorted((gauges or {}).items()):
+        families.setdefault((name, 'gauge'), []).append(f"{METRICS_PREFIX}{name}{_metric_labels(labels)} {value}")
+    for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+        lines = families.setdefault((name, 'histogram'), [])
+        running = 0
+        for bound, n in zip(METRIC_BUCKETS.get(name, TIMING_BUCKETS), buckets):
+            running += n
+            lines.append(f"{METRICS_PREFIX}{name}_bucket{_metric_labels(labels, [('le', repr(float(bound)))])} {running}")
+        lines.append(f"{METRICS_PREFIX}{name}_bucket{_metric_labels(labels, [('le', '+Inf')])} {count}")
+        lines.append(f"{METRICS_PREFIX}{name}_sum{_metric_labels(labels)} {total}")
+        lines.append(f"{METRICS_PREFIX}{name}_count{_metric_labels(labels)} {count}")
+    out = []
+    for (name, kind), lines in sorted(families.items()):
+        if name in METRIC_HELP:
+            out.append(f"# HELP {METRICS_PREFIX}{name} {METRIC_HELP[name]}")
+        out.append(f"# TYPE {METRICS_PREFIX}{name} {kind}")
+        out.extend(lines)
+    return '\n'.join(out) + '\n'
+
+# --- Timing -----------------------------------------------------------------
+# Named spans around the poster pipeline stages (decode, fit, vibe, vignette,
+# palette, font fitting, text layers, tracklist, frame, encode, ...). Each
+# request or render job collects its spans into a record {name: [seconds,
+# count]}; finished records feed the render_stage_seconds histogram. With
+# TIMING_HEADER the record is sent as a Server-Timing header, with
+# TIMING_DEBUG it is also shown on the result page and /debug/timings.
+TIMING_ENABLED = os.environ.get('TIMING', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+# Stage names and durations are debug detail, so the header is opt-in
+TIMING_HEADER = os.environ.get('TIMING_HEADER', '0').strip().lower() in ('1', 'true', 'yes', 'on')
+TIMING_DEBUG = os.environ.get('TIMING_DEBUG', '0').strip().lower() in ('1', 'true', 'yes', 'on')
+
+_timing = threading.local()
+
+def start_timing():
+    """Start collecting spans on this thread; returns the (live) record."""
+    record = {}
+    _timing.record = record
+    return record
+
+def stop_timing():
+    """Stop collecting on this thread and return the record (None if none was started)."""
+    record = getattr(_timing, 'record', None)
+    _timing.record = None
+    return record
+
+def current_timing():
+    return getattr(_timing, 'record', None)
+
+@contextlib.contextmanager
+def span(name):
+    # Nearly free when no record is active (CLI, worker threads, TIMING=0)
+    record = getattr(_timing, 'record', None)
+    if record is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        entry = record.setdefault(name, [0.0, 0])
+        entry[0] += time.perf_counter() - t0
+        entry[1] += 1
+
+def merge_timing(spans, record=None):
+    """Add spans collected elsewhere (a worker process) into record or the current one."""
+    record = record if record is not None else current_timing()
+    if record is None or not spans:
+        return
+    for name, (seconds, count) in spans.items():
+        entry = record.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += count
+
+def observe_timing(record):
+    """Add a finished record to the per-stage histograms."""
+    for name, (seconds, _) in (record or {}).items():
+        observe_metric('render_stage_seconds', seconds, stage=name)
+
+def timing_histograms():
+    """Snapshot {stage: {'buckets': [(le, cumulative count), ...], 'sum', 'count'}}."""
+    _, histograms = collect_metrics()
+    out = {}
+    for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+        if name != 'render_stage_seconds':
+            continue
+        cumulative, running = [], 0
+        for bound, n in zip(TIMING_BUCKETS, buckets):
+            running += n
+            cumulative.append((bound, running))
+        out[dict(labels)['stage']] = {'buckets': cumulative, 'sum': total, 'count': count}
+    return out
+
+def timing_rows(record):
+    """Record as [{'name', 'ms', 'count'}] in pipeline order, for the debug panel."""
+    return [{'name': name, 'ms': round(seconds * 1000, 2), 'count': count}
+            for name, (seconds, count) in (record or {}).items()]
+
+def _server_timing(record, total=None):
+    parts = [f"{name};dur={seconds * 1000:.2f}" for name, (seconds, _) in record.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.2f}")
+    return ', '.join(parts)
+
+def _request_endpoint():
+    # Bounded label values: the view name, with audio split out of static files
+    endpoint = request.endpoint or 'unmatched'
+    if endpoint == 'static' and (request.view_args or {}).get('filename', '').startswith('audio/'):
+        return 'audio'
+    return endpoint
+
+@app.before_request
+def _start_request_timing():
+    _timing.started = time.perf_counter()
+    _timing.status = 500  # unless a response is produced
+    if TIMING_ENABLED:
+        start_timing()
+
+@app.after_request
+def _add_server_timing(response):
+    _timing.status = response.status_code
+    record = current_timing()
+    if record is not None and TIMING_HEADER:
+        response.headers['Server-Timing'] = _server_timing(record, time.perf_counter() - _timing.started)
+    return response
+
+@app.teardown_request
+def _finish_request_timing(exc=None):
+    # Runs after streamed bodies finish, so their time and spans are included.
+    # Streamed responses run teardown twice; only the first one records.
+    record = stop_timing()
+    started = getattr(_timing, 'started', None)
+    if started is None:
+        return
+    _timing.started = None
+    endpoint = _request_endpoint()
+    inc_metric('http_requests_total', endpoint=endpoint, method=request.method, status=str(_timing.status))
+    observe_metric('http_request_duration_seconds', time.perf_counter() - started, endpoint=endpoint)
+    observe_timing(record)
+
+# --- Profiling --------------------------------------------------------------
+# Opt-in profiles of slow renders. PROFILE_MODE=sample runs a stack sampler
+# (one shared thread reading sys._current_frames() every
+# PROFILE_SAMPLE_INTERVAL seconds) and keeps collapsed stacks ("a;b;c count",
+# flamegraph-ready); PROFILE_MODE=cprofile records deterministic pstats
+# instead. Only calls slower than PROFILE_THRESHOLD_MS are written, to
+# PROFILE_DIR, which keeps the newest PROFILE_MAX_FILES files. A request with
+# "X-Profile: <PROFILE_TOKEN>" is profiled whatever the mode and threshold.
+# tools/profile_summary.py merges the files.
+PROFILE_MODE = os.environ.get('PROFILE_MODE', 'off').strip().lower()
+PROFILE_THRESHOLD_MS = float(os.environ.get('PROFILE_THRESHOLD_MS', '500'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
+PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', '100'))
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL', '0.005'))
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+
+_profile_local = threading.local()
+_profile_rotate_lock = threading.Lock()
+
+def _fold_stack(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+class StackSampler:
+    """Samples the stacks of registered threads from one shared daemon thread."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._targets = {}  # thread id -> Counter of folded stacks
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self, thread_id):
+        counts = Counter()
+        with self._cond:
+            self._targets[thread_id] = counts
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return counts
+
+    def stop(self, thread_id):
+        with self._cond:
+            return self._targets.pop(thread_id, None)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                # Sleep until someone is being profiled
+                while not self._targets:
+                    self._cond.wait()
+                targets = list(self._targets.items())
+            frames = sys._current_frames()
+            for thread_id, counts in targets:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    counts[_fold_stack(frame)] += 1
+            del frames
+            time.sleep(self.interval)
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+def _get_sampler():
+    global _sampler
+    if _sampler is None:
+        with _sampler_lock:
+            if _sampler is None:
+                _sampler = StackSampler(PROFILE_SAMPLE_INTERVAL)
+    return _sampler
+
+def _profile_forced():
+    return bool(PROFILE_TOKEN) and has_request_context() and request.headers.get('X-Profile') == PROFILE_TOKEN
+
+def _write_profile(label, elapsed_ms, mode, data):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    ext = 'pstats' if mode == 'cprofile' else 'folded'
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}_{uuid.uuid4().hex[:6]}_{label}_{elapsed_ms:.0f}ms.{ext}"
+    path = os.path.join(PROFILE_DIR, name)
+    tmp_path = f"{path}.tmp"
+    if mode == 'cprofile':
+        data.dump_stats(tmp_path)
+    else:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for stack, count in data.most_common():
+                f.write(f"{stack} {count}\n")
+    os.replace(tmp_path, path)
+    with _profile_rotate_lock:
+        files = sorted((e for e in os.scandir(PROFILE_DIR) if e.name.endswith(('.pstats', '.folded'))),
+                       key=lambda e: e.stat().st_mtime)
+        for entry in files[:max(0, len(files) - PROFILE_MAX_FILES)]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+    return name
+
+@contextlib.contextmanager
+def profile_block(label):
+    """Profile the enclosed code per PROFILE_MODE; keep it if it ran over the threshold."""
+    forced = _profile_forced()
+    mode = PROFILE_MODE if PROFILE_MODE in ('sample', 'cprofile') else ('sample' if forced else None)
+    # Nested blocks (generate_cover_image inside /generate) are covered by the outer one
+    if mode is None or getattr(_profile_local, 'active', False):
+        yield
+        return
+    _profile_local.active = True
+    thread_id = threading.get_ident()
+    profiler = None
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler owns the interpreter (e.g. a concurrent request on 3.12+)
+            profiler = None
+    else:
+        _get_sampler().start(thread_id)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        if mode == 'cprofile':
+            data = profiler
+            if profiler is not None:
+                profiler.disable()
+        else:
+            data = _get_sampler().stop(thread_id)
+        _profile_local.active = False
+        if data and (forced or elapsed_ms >= PROFILE_THRESHOLD_MS):
+            try:
+                _profile_local.saved = _write_profile(label, elapsed_ms, mode, data)
+            except OSError as e:
+                app.logger.warning("Could not write profile: %s", e)
+
+def profiled(label):
+    """Decorator form of profile_block()."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with profile_block(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+@app.before_request
+def _reset_profile_state():
+    _profile_local.saved = None
+
+@app.after_request
+def _add_profile_header(response):
+    # Tell a client that asked for a profile where it went
+    saved = getattr(_profile_local, 'saved', None)
+    if saved and _profile_forced():
+        response.headers['X-Profile-File'] = saved
+    return response
+
+# --- Storage ----------------------------------------------------------------
+# Uploads and posters go through a storage backend (STORAGE_BACKEND):
+#   local   - flat static/uploads/ and static/generated/ (default)
+#   sharded - the same directories split into ab/cd/ subdirectories keyed by a
+#             hash of the file name, so no single directory grows unbounded
+#   memory  - in-process buckets served by /media/<bucket>/<name>, for
+#             ephemeral deployments and as a stand-in for an object store
+# Every backend offers save/save_async/open/read/stat/touch/delete/list/url;
+# url() can be swapped per instance with a url_builder(storage, name, external).
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local').strip().lower()
+STORAGE_WRITERS = int(os.environ.get('STORAGE_WRITERS', '4'))
+STORAGE_MEMORY_MAX_BYTES = int(os.environ.get('STORAGE_MEMORY_MAX_BYTES', str(256 * 1024 * 1024)))
+
+_storage_writer = None
+_storage_writer_lock = threading.Lock()
+
+def _get_storage_writer():
+    global _storage_writer
+    if _storage_writer is None:
+        with _storage_writer_lock:
+            if _storage_writer is None:
+                _storage_writer = ThreadPoolExecutor(max_workers=STORAGE_WRITERS, thread_name_prefix='storage-writer')
+    return _storage_writer
+
+class LocalStorage:
+    """Files in one directory under static/, served by Flask's static route."""
+    # Other processes (render workers) see the same files
+    shared = True
+
+    def __init__(self, root, url_prefix, url_builder=None):
+        self.root = root
+        self.url_prefix = url_prefix
+        self.url_builder = url_builder
+        os.makedirs(root, exist_ok=True)
+
+    def _rel(self, name):
+        return name
+
+    def path(self, name):
+        """Filesystem path of name (None for backends without one)."""
+        return os.path.join(self.root, self._rel(name))
+
+    def save(self, name, data):
+        """Store bytes or a readable binary file under name, atomically."""
+        path = self.path(name)
+        # Write then rename so a concurrent reader never sees a partial file; the
+        # temp name is unique per process and thread (render workers share the tree)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            if isinstance(data, (bytes, bytearray, memoryview)):
+                f.write(data)
+            else:
+                shutil.copyfileobj(data, f)
+            written = f.tell()
+        os.replace(tmp_path, path)
+        inc_metric('storage_bytes_written_total', written, bucket=self.url_prefix)
+        return name
+
+    def save_async(self, name, data):
+        """Queue a save on the shared writer pool; returns a Future."""
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = data.read()
+        return _get_storage_writer().submit(self.save, name, data)
+
+    def open(self, name):
+        return open(self.path(name), 'rb')
+
+    def read(self, name):
+        with self.open(name) as f:
+            return f.read()
+
+    def source(self, name):
+        """Something Image.open() accepts for name: here its path."""
+        return self.path(name)
+
+    def stat(self, name):
+        """(size, mtime, last access) of name, or None if it does not exist."""
+        try:
+            st = os.stat(self.path(name))
+        except OSError:
+            return None
+        # atime is often coarse (relatime/noatime), so a newer mtime (touch) also counts as an access
+        return st.st_size, st.st_mtime, max(st.st_atime, st.st_mtime)
+
+    def touch(self, name):
+        try:
+            os.utime(self.path(name))
+            return True
+        except OSError:
+            return False
+
+    def delete(self, name):
+        try:
+            os.remove(self.path(name))
+        except OSError:
+            pass
+
+    def list(self):
+        """Yield stored names."""
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    yield entry.name
+
+    def url(self, name, external=False):
+        if self.url_builder is not None:
+            return self.url_builder(self, name, external)
+        return url_for('static', filename=f"{self.url_prefix}/{self._rel(name)}", _external=external)
+
+class ShardedStorage(LocalStorage):
+    """LocalStorage spread over two levels of hash-prefixed subdirectories (ab/cd/name)."""
+
+    def _rel(self, name):
+        digest = hashlib.md5(name.encode('utf-8')).hexdigest()
+        return f"{digest[:2]}/{digest[2:4]}/{name}"
+
+    def save(self, name, data):
+        os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+        return super().save(name, data)
+
+    def list(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if not filename.endswith('.tmp'):
+                    yield filename
+
+class MemoryStorage:
+    """In-process bucket served by the /media route; oldest files are dropped past max_bytes."""
+    # Render worker processes cannot see this process's memory
+    shared = False
+
+    def __init__(self, bucket, max_bytes=STORAGE_MEMORY_MAX_BYTES, url_builder=None):
+        self.bucket = bucket
+        self.max_bytes = max_bytes
+        self.url_builder = url_builder
+        self._files = OrderedDict()  # name -> (bytes, mtime), oldest first
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def path(self, name):
+        return None
+
+    def save(self, name, data):
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = data.read()
+        data = bytes(data)
+        with self._lock:
+            old = self._files.pop(name, None)
+            if old is not None:
+                self._bytes -= len(old[0])
+            self._files[name] = (data, time.time())
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes and len(self._files) > 1:
+                _, (dropped, _) = self._files.popitem(last=False)
+                self._bytes -= len(dropped)
+        inc_metric('storage_bytes_written_total', len(data), bucket=self.bucket)
+        return name
+
+    def save_async(self, name, data):
+        # Nothing to wait for in memory
+        future = Future()
+        future.set_result(self.save(name, data))
+        return future
+
+    def read(self, name):
+        with self._lock:
+            return self._files[name][0]
+
+    def open(self, name):
+        return io.BytesIO(self.read(name))
+
+    def source(self, name):
+        """Something Image.open() accepts for name: a private in-memory file."""
+        return self.open(name)
+
+    def stat(self, name):
+        with self._lock:
+            item = self._files.get(name)
+        return None if item is None else (len(item[0]), item[1], item[1])
+
+    def touch(self, name):
+        with self._lock:
+            item = self._files.get(name)
+            if item is None:
+                return False
+            self._files[name] = (item[0], time.time())
+            self._files.move_to_end(name)
+            return True
+
+    def delete(self, name):
+        with self._lock:
+            item = self._files.pop(name, None)
+            if item is not None:
+                self._bytes -= len(item[0])
+
+    def list(self):
+        with self._lock:
+            return list(self._files)
+
+    def url(self, name, external=False):
+        if self.url_builder is not None:
+            return self.url_builder(self, name, external)
+        return url_for('media', bucket=self.bucket, name=name, _external=external)
+
+_memory_buckets = {}
+
+def make_storage(bucket, backend=STORAGE_BACKEND):
+    """Storage for a static/ bucket ('uploads' or 'generated') with the given backend."""
+    if backend == 'memory':
+        storage = _memory_buckets[bucket] = MemoryStorage(bucket)
+    elif backend == 'sharded':
+        storage = ShardedStorage(os.path.join(STATIC_DIR, bucket), bucket)
+    else:
+        storage = LocalStorage(os.path.join(STATIC_DIR, bucket), bucket)
+    return storage
+
+upload_storage = make_storage('uploads')
+poster_storage = make_storage('generated')
+
+# --- Retention --------------------------------------------------------------
+# A janitor per bucket deletes files older than max_age seconds and, while the
+# bucket is above max_bytes, the least recently accessed ones. Each pass stats
+# only JANITOR_BATCH more entries (resuming a directory walk where the last pass
+# stopped) and works from the index built so far, so a pass never rescans the
+# whole tree. Files younger than JANITOR_MIN_AGE are never evicted for size, so
+# uploads waiting in the render queue are safe. Render cache sidecars
+# (cover_<key>.json) count towards their poster's size and are deleted with it,
+# through the render cache so its index and byte count stay in step.
+JANITOR_INTERVAL = int(os.environ.get('JANITOR_INTERVAL', '300'))
+JANITOR_BATCH = int(os.environ.get('JANITOR_BATCH', '1000'))
+JANITOR_MIN_AGE = int(os.environ.get('JANITOR_MIN_AGE', '600'))
+RETENTION = {
+    'uploads': (float(os.environ.get('RETENTION_UPLOADS_DAYS', '7')) * 86400,
+                int(os.environ.get('RETENTION_UPLOADS_MAX_BYTES', str(1024 ** 3)))),
+    'generated': (float(os.environ.get('RETENTION_GENERATED_DAYS', '30')) * 86400,
+                  int(os.environ.get('RETENTION_GENERATED_MAX_BYTES', str(2 * 1024 ** 3)))),
+}
+
+class Janitor:
+    """Incremental age and size retention for one storage bucket (0 disables a limit)."""
+
+    def __init__(self, storage, max_age=0, max_bytes=0, batch=None, min_age=None, dry_run=False):
+        self.storage = storage
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.batch = batch or JANITOR_BATCH
+        self.min_age = JANITOR_MIN_AGE if min_age is None else min_age
+        self.dry_run = dry_run
+        self._index = {}  # name -> (size, last access)
+        self._bytes = 0
+        self._cursor = None
+        self.sweeps = 0  # completed walks over the whole bucket
+        self._dry_deleted = set()  # dry run: names already reported, kept out of the index
+        self._lock = threading.Lock()
+
+    def _track(self, name, st):
+        if name in self._dry_deleted:
+            return
+        old = self._index.pop(name, None)
+        if old is not None:
+            self._bytes -= old[0]
+        if st is not None:
+            self._index[name] = (st[0], st[2])
+            self._bytes += st[0]
+
+    def _scan(self):
+        scanned = 0
+        while scanned < self.batch:
+            if self._cursor is None:
+                self._cursor = iter(self.storage.list())
+            name = next(self._cursor, None)
+            if name is None:
+                self._cursor = None
+                self.sweeps += 1
+                break
+            scanned += 1
+            if name.startswith('cover_') and name.endswith('.json'):
+                # Sidecars go with their poster; only orphans are handled here
+                if self.storage.stat(name[:-len('.json')] + '.jpg') is None:
+                    self._delete(name, None)
+                continue
+            self._track(name, self._stat(name))
+        return scanned
+
+    def _stat(self, name):
+        # A poster's size includes its render cache sidecar
+        st = self.storage.stat(name)
+        if st is not None and name.startswith('cover_') and name.endswith('.jpg'):
+            sidecar = self.storage.stat(name[:-len('.jpg')] + '.json')
+            if sidecar is not None:
+                st = (st[0] + sidecar[0],) + tuple(st[1:])
+        return st
+
+    def _delete(self, name, report):
+        self._track(name, None)
+        names = [name]
+        if name.startswith('cover_') and name.endswith('.jpg'):
+            names.append(name[:-len('.jpg')] + '.json')
+        found = []
+        for n in names:
+            st = self.storage.stat(n)
+            if st is not None and not (self.dry_run and n in self._dry_deleted):
+                found.append((n, st))
+        if not found:
+            return
+        if self.dry_run:
+            self._dry_deleted.update(n for n, _ in found)
+        elif name.startswith('cover_') and self.storage is poster_storage:
+            render_cache_discard(name[len('cover_'):].rsplit('.', 1)[0])
+        else:
+            for n, _ in found:
+                self.storage.delete(n)
+        if report is not None:
+            report['deleted'] += len(found)
+            report['bytes_reclaimed'] += sum(st[0] for _, st in found)
+
+    def run_once(self, now=None):
+        """Scan the next batch, apply the limits and return a report dict."""
+        now = time.time() if now is None else now
+        report = {'scanned': 0, 'deleted': 0, 'bytes_reclaimed': 0}
+        with self._lock:
+            report['scanned'] = self._scan()
+            budget = self.batch
+            if self.max_age > 0:
+                expired = [n for n, (_, seen) in self._index.items() if now - seen > self.max_age]
+                for name in expired[:budget]:
+                    # Re-check: the file may have been used since it was indexed
+                    st = self._stat(name)
+                    if st is not None and now - st[2] > self.max_age:
+                        self._delete(name, report)
+                        budget -= 1
+                    else:
+                        self._track(name, st)
+            if self.max_bytes > 0 and self._bytes > self.max_bytes:
+                # Least recently accessed first
+                for name, (_, seen) in sorted(self._index.items(), key=lambda item: item[1][1]):
+                    if self._bytes <= self.max_bytes or budget <= 0 or now - seen < self.min_age:
+                        break
+                    st = self._stat(name)
+                    if st is not None and st[2] > seen:
+                        self._track(name, st)  # used since indexed; reconsider next pass
+                        continue
+                    self._delete(name, report)
+                    budget -= 1
+            report['tracked_files'] = len(self._index)
+            report['tracked_bytes'] = self._bytes
+            report['sweeps'] = self.sweeps
+        return report
+
+_janitors = {}
+_janitor_thread = None
+_janitor_thread_lock = threading.Lock()
+
+def get_janitor(bucket):
+    """Janitor for 'uploads' or 'generated' configured from RETENTION_*."""
+    if bucket not in _janitors:
+        storage = upload_storage if bucket == 'uploads' else poster_storage
+        max_age, max_bytes = RETENTION[bucket]
+        _janitors[bucket] = Janitor(storage, max_age=max_age, max_bytes=max_bytes)
+    return _janitors[bucket]
+
+def _janitor_loop(interval):
+    while True:
+        for bucket in RETENTION:
+            try:
+                report = get_janitor(bucket).run_once()
+            except Exception:
+                app.logger.exception("Janitor pass over %s failed", bucket)
+                continue
+            if report['deleted']:
+                app.logger.info("Janitor removed %d file(s) from %s, reclaimed %d bytes",
+                                report['deleted'], bucket, report['bytes_reclaimed'])
+        time.sleep(interval)
+
+def start_janitor(interval=None):
+    """Start the background retention thread (once per process)."""
+    global _janitor_thread
+    interval = interval or JANITOR_INTERVAL
+    with _janitor_thread_lock:
+        if _janitor_thread is None and interval > 0:
+            _janitor_thread = threading.Thread(target=_janitor_loop, args=(interval,), name='janitor', daemon=True)
+            _janitor_thread.start()
+    return _janitor_thread
+
 def _pick_text_color(bg_rgb):
     r, g, b = bg_rgb
     # perceived luminance
     luminance = 0.299*r + 0.587*g + 0.114*b
     return (0, 0, 0) if luminance > 160 else (255, 255, 255)
 
-def _apply_vibe_filter(img, vibe, energy):
+# Photo treatment is compiled per (vibe, energy, style) into a program of
+# spatial filters plus per-pixel color stages. Every color stage (contrast,
+# saturation, brightness, flat tint, duotone) is affine in RGB, so a chain of
+# them collapses into one 3x4 matrix applied in a single Image.convert pass.
+_L_WEIGHTS = (0.299, 0.587, 0.114)  # same weights as Pillow's RGB -> L
+
+VIBES = ('Regal', 'Goofball', 'Adventurer', 'Snuggler', 'Bossy', 'Wise Sage')
+
+def _vibe_stages(vibe):
+    # (spatial filters, color stages) equivalent to the per-vibe ImageEnhance chains
     if vibe == 'Regal':
-        img = ImageEnhance.Contrast(img).enhance(1.1)
-        gold = Image.new('RGBA', img.size, (212, 175, 55, 28))
-        img = Image.alpha_composite(img.convert('RGBA'), gold).convert('RGB')
+        return (), (('contrast', 1.1), ('tint', (212, 175, 55), 28))
     elif vibe == 'Goofball':
-        img = ImageEnhance.Color(img).enhance(1.3)
-        img = ImageEnhance.Brightness(img).enhance(1.05)
+        return (), (('color', 1.3), ('brightness', 1.05))
     elif vibe == 'Adventurer':
-        warm = Image.new('RGBA', img.size, (255, 140, 0, 24))
-        img = Image.alpha_composite(img.convert('RGBA'), warm).convert('RGB')
-        img = ImageEnhance.Contrast(img).enhance(1.05)
+        return (), (('tint', (255, 140, 0), 24), ('contrast', 1.05))
     elif vibe == 'Snuggler':
-        img = img.filter(ImageFilter.GaussianBlur(radius=0.8))
-        pastel = Image.new('RGBA', img.size, (255, 192, 203, 20))
-        img = Image.alpha_composite(img.convert('RGBA'), pastel).convert('RGB')
+        return (('blur', 0.8),), (('tint', (255, 192, 203), 20),)
     elif vibe == 'Bossy':
-        img = ImageEnhance.Contrast(img).enhance(1.25)
-        img = ImageEnhance.Sharpness(img).enhance(1.1)
+        # Sharpening is linear with unit gain, so it commutes with the color stages
+        return (('sharpness', 1.1),), (('contrast', 1.25),)
     elif vibe == 'Wise Sage':
-        gray = ImageOps.grayscale(img)
-        img = ImageOps.colorize(gray, black="#3b2f2f", white="#f5e6c8")
-    # Energy tweaks
-    if energy == 'Zoomies Every Hour':
-        img = ImageEnhance.Contrast(img).enhance(1.05)
-    elif energy == 'Chill':
-        img = ImageEnhance.Color(img).enhance(0.95)
-    return img
-
-def _dominant_color(img, k=5):
-    # Analyze dominant color of the image using adaptive palette
-    small = img.copy().resize((120, 120), Image.Resampling.BILINEAR)
-    pal = small.convert('P', palette=Image.Palette.ADAPTIVE, colors=max(2, k))
-    pal = pal.convert('RGB')
-    colors = pal.getcolors(120*120) or []
-    # Sort by frequency desc
-    colors.sort(key=lambda c: c[0], reverse=True)
+        return (), (('colorize', (0x3b, 0x2f, 0x2f), (0xf5, 0xe6, 0xc8)),)
+    return (), ()
+
+# Energy tweaks
+_ENERGY_STAGES = {
+    'Zoomies Every Hour': (('contrast', 1.05),),
+    'Chill': (('color', 0.95),),
+}
+
+# Poster preset: (color stages, post-color spatial effects)
+_STYLE_STAGES = {
+    # Subtle blue/orange split tint on the photo
+    'californication': ((), (('gradient',),)),
+    # Deep blue tint and soft vignette
+    'melodrama': ((('tint', (20, 40, 120), 40),), (('vignette', 0.55),)),
+    # High contrast and grain
+    'gig': ((('contrast', 1.25), ('color', 1.1)), (('grain', 18),)),
+}
+
+def _photo_program(vibe, energy, style=None):
+    # Unknown form values render like no value, so they share one cache entry
+    return _photo_program_cached(vibe if vibe in VIBES else None,
+                                 energy if energy in _ENERGY_STAGES else None,
+                                 style if style in _STYLE_STAGES else None)
+
+@functools.lru_cache(maxsize=64)
+def _photo_program_cached(vibe, energy, style):
+    spatial, color = _vibe_stages(vibe)
+    color = color + _ENERGY_STAGES.get(energy, ())
+    style_color, post = _STYLE_STAGES.get(style, ((), ()))
+    return spatial, color + style_color, post
+
+def _stage_matrix(op, args, mean_rgb):
+    # 3x4 affine matrix (rows: r, g, b output; columns: r, g, b, offset) of one stage
+    if op == 'contrast':
+        # ImageEnhance.Contrast pulls towards the rounded mean gray of the current image
+        f = args[0]
+        gray = int(sum(w*c for w, c in zip(_L_WEIGHTS, mean_rgb)) + 0.5)
+        return [[f if i == j else 0.0 for j in range(3)] + [(1-f)*gray] for i in range(3)]
+    if op == 'color':
+        # ImageEnhance.Color blends with the image's own grayscale
+        f = args[0]
+        return [[f*(i == j) + (1-f)*_L_WEIGHTS[j] for j in range(3)] + [0.0] for i in range(3)]
+    if op == 'brightness':
+        f = args[0]
+        return [[f if i == j else 0.0 for j in range(3)] + [0.0] for i in range(3)]
+    if op == 'tint':
+        # alpha_composite of a flat RGBA color over an opaque image
+        rgb, alpha = args
+        a = alpha / 255.0
+        return [[(1-a) if i == j else 0.0 for j in range(3)] + [rgb[i]*a] for i in range(3)]
+    if op == 'colorize':
+        # ImageOps.colorize(grayscale, black, white): linear ramp between two colors
+        black, white = args
+        return [[(white[i]-black[i])/255.0*_L_WEIGHTS[j] for j in range(3)] + [float(black[i])] for i in range(3)]
+    raise ValueError(f"unknown color stage: {op}")
+
+def _compose_affine(outer, inner):
+    return [[sum(outer[i][k]*inner[k][j] for k in range(3)) + (outer[i][3] if j == 3 else 0.0)
+             for j in range(4)] for i in range(3)]
+
+def _apply_affine(m, rgb):
+    return [sum(m[i][j]*rgb[j] for j in range(3)) + m[i][3] for i in range(3)]
+
+def _color_matrix(stages, mean_rgb):
+    matrix = [[1.0 if i == j else 0.0 for j in range(3)] + [0.0] for i in range(3)]
+    mean = list(mean_rgb)
+    for op, *args in stages:
+        stage = _stage_matrix(op, args, mean)
+        matrix = _compose_affine(stage, matrix)
+        mean = _apply_affine(stage, mean)
+    return matrix
+
+def _apply_color_program(img, spatial, stages):
+    for op, arg in spatial:
+        if op == 'blur':
+            img = img.filter(ImageFilter.GaussianBlur(radius=arg))
+        elif op == 'sharpness':
+            img = ImageEnhance.Sharpness(img).enhance(arg)
+    if not stages:
+        return img
+    # Only contrast depends on image content (its mean); other stages ignore it
+    needs_mean = any(op == 'contrast' for op, *_ in stages)
+    mean_rgb = ImageStat.Stat(img).mean if needs_mean else (0.0, 0.0, 0.0)
+    matrix = _color_matrix(stages, mean_rgb)
+    return img.convert('RGB', tuple(v for row in matrix for v in row))
+
+def _apply_vibe_filter(img, vibe, energy):
+    spatial, stages, _ = _photo_program(vibe, energy)
+    return _apply_color_program(img, spatial, stages)
+
+PALETTE_SAMPLE = 128  # strided sample edge used for palette extraction
+_PALETTE_BITS = 3  # bits kept per channel when binning colors (8x8x8 bins)
+
+def _luma(rgb):
+    r, g, b = rgb
+    return 0.299*r + 0.587*g + 0.114*b
+
+def _extract_palette(img, k=5):
+    """Ranked palette of an RGB image as [(count, (r, g, b)), ...], most frequent first.
+
+    A strided pixel sample is binned into a coarse RGB histogram and every
+    non-empty bin is returned as its mean color. NumPy only makes this faster:
+    the pure-Pillow path gives the same palette, so poster colors do not depend
+    on whether it is installed. k is unused and kept for callers.
+    """
+    # Nearest-neighbour resize is a strided pick of source pixels, not a filter pass
+    if max(img.size) > PALETTE_SAMPLE:
+        img = img.resize((PALETTE_SAMPLE, PALETTE_SAMPLE), Image.Resampling.NEAREST)
+    shift = 8 - _PALETTE_BITS
+    np = _numpy()
+    if np is None:
+        bins = {}
+        for count, (r, g, b) in img.getcolors(img.width * img.height):
+            key = ((r >> shift) << (2*_PALETTE_BITS)) | ((g >> shift) << _PALETTE_BITS) | (b >> shift)
+            acc = bins.setdefault(key, [0, 0, 0, 0])
+            acc[0] += count
+            acc[1] += r * count
+            acc[2] += g * count
+            acc[3] += b * count
+        # Most frequent first; ties in descending bin order, like the NumPy path
+        ranked = sorted(bins.items(), key=lambda item: (item[1][0], item[0]), reverse=True)
+        return [(n, (int(r / n + 0.5), int(g / n + 0.5), int(b / n + 0.5))) for _, (n, r, g, b) in ranked]
+    px = np.asarray(img, dtype=np.uint8).reshape(-1, 3)
+    q = (px >> shift).astype(np.intp)
+    bins = (q[:, 0] << (2*_PALETTE_BITS)) | (q[:, 1] << _PALETTE_BITS) | q[:, 2]
+    n_bins = 1 << (3*_PALETTE_BITS)
+    counts = np.bincount(bins, minlength=n_bins)
+    sums = np.stack([np.bincount(bins, weights=px[:, c], minlength=n_bins) for c in range(3)], axis=1)
+    ranked = np.argsort(counts, kind='stable')[::-1]
+    ranked = ranked[counts[ranked] > 0]
+    means = (sums[ranked] / counts[ranked, None] + 0.5).astype(np.int64)
+    return [(int(c), tuple(int(v) for v in rgb)) for c, rgb in zip(counts[ranked], means)]
+
+def _dominant_color(img, k=5, palette=None):
+    # Analyze dominant color of the image: most frequent of the top k palette colors
+    colors = palette if palette is not None else _extract_palette(img, k)
     # Filter out too dark/too light extremes
-    def lum(rgb):
-        r,g,b = rgb
-        return 0.299*r + 0.587*g + 0.114*b
-    for count, rgb in colors:
-        L = lum(rgb)
+    for count, rgb in colors[:max(2, k)]:
+        L = _luma(rgb)
         if 30 < L < 230:
             return rgb
     # Fallback to a soft cream
@@ -98,18 +1098,56 @@ def _windows_fonts_dir():
     win_dir = os.environ.get('WINDIR', r'C:\\Windows')
     return os.path.join(win_dir, 'Fonts')
 
+# Font registry: one {lowercase file name: path} index per font dir, built once
+# per process. Dirs stay in search order so static/fonts still wins.
+_font_registry = None
+_font_registry_lock = threading.Lock()
+
+def _build_font_registry():
+    registry = []
+    for d in (os.path.join(STATIC_DIR, 'fonts'), _windows_fonts_dir()):
+        try:
+            entries = os.listdir(d)
+        except OSError:
+            continue
+        # Windows file lookups are case-insensitive, so index case-folded names
+        registry.append({name.lower(): os.path.join(d, name) for name in entries})
+    return registry
+
+def refresh_font_registry():
+    """Re-index font files (e.g. after dropping new fonts into static/fonts)."""
+    global _font_registry
+    registry = _build_font_registry()
+    with _font_registry_lock:
+        _font_registry = registry
+    _cached_font.cache_clear()
+    # Cached layouts hold sizes fitted against the old fonts
+    _layout_cover_cached.cache_clear()
+    return registry
+
+def _get_font_registry():
+    global _font_registry
+    if _font_registry is None:
+        with _font_registry_lock:
+            if _font_registry is None:
+                _font_registry = _build_font_registry()
+    return _font_registry
+
 def _resolve_font_path(candidates):
     # Search in static/fonts first, then Windows fonts
-    search_dirs = [os.path.join(STATIC_DIR, 'fonts'), _windows_fonts_dir()]
-    for d in search_dirs:
+    for index in _get_font_registry():
         for name in candidates:
-            p = os.path.join(d, name)
-            if os.path.exists(p):
+            p = index.get(name.lower())
+            if p:
                 return p
     return None
 
-def _load_font(candidates, size):
-    path = _resolve_font_path(candidates)
+FONT_CACHE_SIZE = int(os.environ.get('FONT_CACHE_SIZE', '256'))
+
+@functools.lru_cache(maxsize=FONT_CACHE_SIZE)
+def _cached_font(path, size):
+    # Loaded fonts are only read from after creation, so one instance is shared
+    # by every request thread. path=None goes straight to the fallback chain.
     if path:
         try:
             return ImageFont.truetype(path, size)
@@ -121,6 +1159,54 @@ def _load_font(candidates, size):
     except Exception:
         return ImageFont.load_default()
 
+def _load_font(candidates, size):
+    return _cached_font(_resolve_font_path(candidates), size)
+
+def _fit_size(fits, start_size, min_size, guess=None):
+    """Largest size in [min_size, start_size] for which fits(size) is true.
+
+    Text extents grow (almost) linearly with font size, so callers can pass a
+    guess predicted from one reference measurement; the search then only has
+    to confirm a small bracket around it instead of stepping 1px at a time.
+    Returns min_size when nothing fits, like the old countdown loops.
+    """
+    lo, hi = min_size - 1, start_size  # lo: known to fit (or below range), hi+1: known not to
+    if hi < min_size:
+        return min_size
+    if guess is not None:
+        guess = max(min_size, min(start_size, int(guess)))
+        step = max(2, guess // 20)
+        if fits(guess):
+            lo = guess
+            probe = guess + step
+            if probe <= hi:
+                if fits(probe):
+                    lo = probe
+                else:
+                    hi = probe - 1
+        else:
+            hi = guess - 1
+            probe = guess - step
+            if probe >= min_size:
+                if fits(probe):
+                    lo = probe
+                else:
+                    hi = probe - 1
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if fits(mid):
+            lo = mid
+        else:
+            hi = mid - 1
+    return max(lo, min_size)
+
+def _predict_size(ref_size, *ratios):
+    # Size at which every measured extent scales down (or up) to its limit
+    ratios = [r for r in ratios if r is not None]
+    if not ratios:
+        return None
+    return ref_size * min(ratios)
+
 def _fonts_for_vibe(vibe, title_size, artist_size):
     # Map vibe to likely font files (Windows names)
     vibe_map = {
@@ -134,566 +1220,1136 @@ def _fonts_for_vibe(vibe, title_size, artist_size):
     title_candidates, artist_candidates = vibe_map.get(vibe, (['arial.ttf'], ['arial.ttf']))
     return _load_font(title_candidates, title_size), _load_font(artist_candidates, artist_size)
 
+# Per-font glyph tables, filled lazily and dropped with the font object:
+# {'adv': {ch: advance px}, 'mask': {(ch, stroke_width): (L image, dx, dy)}}
+_glyph_tables = weakref.WeakKeyDictionary()
+
+def _glyph_table(font):
+    table = _glyph_tables.get(font)
+    if table is None:
+        table = _glyph_tables.setdefault(font, {'adv': {}, 'mask': {}})
+    return table
+
+def _glyph_advance(font, ch):
+    # Same per-character step the spaced layout has always used (bbox right edge)
+    adv = _glyph_table(font)['adv']
+    w = adv.get(ch)
+    if w is None:
+        w = adv[ch] = font.getbbox(ch)[2]
+    return w
+
+def _glyph_mask(font, ch, stroke_width=0):
+    masks = _glyph_table(font)['mask']
+    key = (ch, stroke_width)
+    entry = masks.get(key)
+    if entry is None:
+        left, top, right, bottom = font.getbbox(ch, stroke_width=stroke_width)
+        glyph = Image.new('L', (max(1, right - left), max(1, bottom - top)), 0)
+        ImageDraw.Draw(glyph).text((-left, -top), ch, font=font, fill=255, stroke_width=stroke_width)
+        entry = masks[key] = (glyph, left, top)
+    return entry
+
+def _measure_spaced_width(text, font, spacing):
+    total = sum(_glyph_advance(font, ch) for ch in text)
+    if text:
+        total += spacing * (len(text) - 1)
+    return max(total, 1)
+
+def _spaced_text_mask(text, font, spacing, stroke_width=0):
+    # Compose one coverage mask for the whole spaced string from cached glyphs.
+    # Returns (mask, (dx, dy)) relative to the text origin, or (None, None).
+    placed = []
+    x = 0
+    for ch in text:
+        glyph, left, top = _glyph_mask(font, ch, stroke_width)
+        placed.append((glyph, x + left, top))
+        x += _glyph_advance(font, ch) + spacing
+    if not placed:
+        return None, None
+    x0 = min(gx for _, gx, _ in placed)
+    y0 = min(gy for _, _, gy in placed)
+    x1 = max(gx + g.size[0] for g, gx, _ in placed)
+    y1 = max(gy + g.size[1] for g, _, gy in placed)
+    mask = Image.new('L', (x1 - x0, y1 - y0), 0)
+    for glyph, gx, gy in placed:
+        mask.paste(255, (gx - x0, gy - y0), glyph)
+    return mask, (x0, y0)
+
 def _draw_text_with_spacing(draw, position, text, font, fill, spacing=0, stroke_width=0, stroke_fill=None):
     if spacing <= 0:
         draw.text(position, text, font=font, fill=fill, stroke_width=stroke_width, stroke_fill=stroke_fill)
         return
     x, y = position
-    for ch in text:
-        draw.text((x, y), ch, font=font, fill=fill, stroke_width=stroke_width, stroke_fill=stroke_fill)
-        w, h = draw.textbbox((0, 0), ch, font=font)[2:]
-        x += w + spacing
-
-def generate_cover_image(pet_info, photo_path=None, tracks=None, out_dir=GENERATED_DIR, size=1024, track_boxes=None):
-    # Load image or fallback solid background
-    if photo_path and os.path.exists(photo_path):
-        img = Image.open(photo_path).convert('RGB')
-    else:
-        # fallback solid
-        img = Image.new('RGB', (size, size), (50, 70, 100))
-    # keep a copy of the original photo for square placement later
-    src = img.copy()
+    # One bitmap pass per layer: the outline first, then the fill on top of it
+    layers = [(stroke_width, fill if stroke_fill is None else stroke_fill)] if stroke_width else []
+    layers.append((0, fill))
+    for layer_stroke, ink in layers:
+        mask, offset = _spaced_text_mask(text, font, spacing, layer_stroke)
+        if mask is not None:
+            draw.bitmap((x + offset[0], y + offset[1]), mask, fill=ink)
+
+# Font candidate lists used by the poster layout (Windows names, static/fonts first)
+_TITLE_FONTS = [
+    'impact.ttf', 'ariblk.ttf', 'arialbd.ttf',
+    'bahnschrift.ttf', 'segoeuib.ttf',
+    'Poppins-Black.ttf', 'Poppins-Black.otf',
+    'Poppins-ExtraBold.ttf', 'Poppins-ExtraBold.otf'
+]
+# Lock artist font to Bahnschrift for consistency
+_ARTIST_FONTS = ['bahnschrift.ttf']
+_ARTIST_SAFE_FONTS = ['bahnschrift.ttf', 'arialbd.ttf', 'segoeuib.ttf', 'impact.ttf']
+_TRACK_BODY_FONTS = ['segoeui.ttf', 'arial.ttf']
+_TRACK_NUM_FONTS = ['bahnschrift.ttf', 'arialbd.ttf', 'segoeui.ttf']
+_STICKER_FONTS = ['bahnschrift.ttf', 'arialbd.ttf', 'segoeui.ttf']
+
+LAYOUT_CACHE_SIZE = int(os.environ.get('LAYOUT_CACHE_SIZE', '128'))
+
+def _font_spec(candidates, size):
+    # Layout plans reference fonts by (candidates, size) so they stay serializable
+    return {'candidates': list(candidates), 'size': int(size)}
+
+def _plan_font(spec):
+    return _load_font(spec['candidates'], spec['size'])
+
+def _measure_draw():
+    # Measuring never touches pixels, so a 1x1 scratch surface is enough
+    return ImageDraw.Draw(Image.new('RGB', (1, 1)))
+
+def _poster_stickers(pet_info):
+    # Optional stickers based on traits (minimal, simple icons)
+    stickers = []
+    if pet_info.get('vocalness_description') == 'Opera' or pet_info.get('sneakiness') == 'Master thief':
+        stickers.append('Deluxe')
+    if pet_info.get('wingman_activity') == 'Park meetups':
+        stickers.append('Live at the Park')
+    if pet_info.get('wingman_activity') in ('People-watching', 'Bird TV'):
+        stickers.append('Window Sessions')
+    return stickers
 
-    # Poster is always on; style controls photo treatment only
-    poster_mode = True
-    # Force single photo effect: melodrama only
-    poster_style = 'melodrama'
+def layout_cover(pet_info, tracks, size=1024):
+    """Compute the poster layout plan for the given texts (no pixels are pushed).
 
-    # Poster 4:5 aspect
-    if poster_mode:
-        width, height = size, int(size * 1.25)
-    else:
-        width, height = size, size
+    The plan is a JSON-serializable dict of boxes, font specs and text runs that
+    render_cover_layout() executes. Plans are cached per distinct text input, so
+    callers get their own copy and may mutate it freely.
+    """
+    title = pet_info.get('album_title', 'Greatest Hits')
+    artist = pet_info.get('artist_name', 'The Artist')
+    # Normalize track titles (numbering is re-applied as 01., 02., ...)
+    titles = []
+    for t in (tracks or []):
+        try:
+            # Remove any existing numbering
+            titles.append(t.split('. ', 1)[1])
+        except Exception:
+            titles.append(t)
+    with span('layout'):
+        plan = _layout_cover_cached(title, artist, tuple(titles), tuple(_poster_stickers(pet_info)), size)
+        return copy.deepcopy(plan)
 
-    # Apply vibe and style to the photo only; background will be derived from photo palette
-    vibe = pet_info.get('vibe')
-    energy = pet_info.get('energy')
-    # Background will be set later after analyzing photo colors
+@functools.lru_cache(maxsize=LAYOUT_CACHE_SIZE)
+def _layout_cover_cached(title, artist, track_titles, stickers, size):
+    draw = _measure_draw()
+
+    # Poster 4:5 aspect
+    width, height = size, int(size * 1.25)
 
     # Square photo placement
     photo_side = int(width * 0.78)
     px = (width - photo_side) // 2
-    py = int(height * 0.07)
-    photo = ImageOps.fit(src, (photo_side, photo_side), method=Image.Resampling.LANCZOS, centering=(0.5, 0.5))
-    photo = _apply_vibe_filter(photo, vibe, energy)
 
-    # Poster preset overlays
-    def apply_vignette(im, strength=0.5):
-        w, h = im.size
-        vignette = Image.new('L', (w, h), 0)
-        draw_v = ImageDraw.Draw(vignette)
-        draw_v.ellipse((int(-0.1*w), int(-0.2*h), int(1.1*w), int(1.2*h)), fill=int(255*strength))
-        vignette = vignette.filter(ImageFilter.GaussianBlur(radius=int(min(w, h)*0.08)))
-        return Image.composite(Image.new('RGB', (w, h), (0, 0, 0)), im, ImageOps.invert(vignette)).convert('RGB')
-
-    def apply_grain(im, opacity=24):
-        w, h = im.size
-        noise = Image.effect_noise((w, h), 8).convert('L')
-        noise_rgb = Image.merge('RGB', (noise, noise, noise))
-        return Image.blend(im, noise_rgb, opacity/255.0)
-
-    # Use only melodrama photo treatment
-    chosen_style = 'melodrama'
-
-    if poster_mode:
-        if chosen_style == 'californication':
-            # Subtle blue/orange split tint on the photo
-            w, h = photo.size
-            grad = Image.new('RGBA', (w, h), (0, 0, 0, 0))
-            gdraw = ImageDraw.Draw(grad)
-            for y in range(h):
-                t = y / h
-                r = int(255 * (1-t) * 0.2 + 255 * t * 0.8)
-                b = int(255 * (1-t) * 0.8 + 255 * t * 0.2)
-                gdraw.line([(0, y), (w, y)], fill=(r, 100, b, 30))
-            photo = Image.alpha_composite(photo.convert('RGBA'), grad).convert('RGB')
-        elif chosen_style == 'melodrama':
-            # Deep blue tint and soft vignette
-            blue = Image.new('RGBA', photo.size, (20, 40, 120, 40))
-            photo = Image.alpha_composite(photo.convert('RGBA'), blue).convert('RGB')
-            photo = apply_vignette(photo, strength=0.55)
-        elif chosen_style == 'gig':
-            # High contrast and grain
-            photo = ImageEnhance.Contrast(photo).enhance(1.25)
-            photo = ImageEnhance.Color(photo).enhance(1.1)
-            photo = apply_grain(photo, opacity=18)
-
-    # Defer pasting photo until we position title and create poster
-
-    # Create poster background based on photo palette
-    dom = _dominant_color(photo)
-    bg_color = _lighten_for_background(dom)
-
-    def _darken_for_text(rgb, max_luma=150):
-        r, g, b = rgb
-        def lum(rr, gg, bb):
-            return 0.299*rr + 0.587*gg + 0.114*bb
-        # Darken towards black until sufficiently dark for contrast
-        for _ in range(8):
-            if lum(r, g, b) <= max_luma:
-                break
-            r = int(r * 0.85)
-            g = int(g * 0.85)
-            b = int(b * 0.85)
-        return (r, g, b)
-
-    title_color = dom
-    text_color = _darken_for_text(dom)
-    poster = Image.new('RGB', (width, height), bg_color)
-    draw = ImageDraw.Draw(poster)
-    cream = (245, 240, 225)
-
-    # Titles
-    title = pet_info.get('album_title', 'Greatest Hits')
-    artist = pet_info.get('artist_name', 'The Artist')
-
-    # Special typography for Californication poster style
-    # Text layout is always Californication-style typography
-    cali_typo = True
-    if cali_typo:
-        # Uppercase artist and album for a clean poster hierarchy
-        artist_u = (artist or 'The Artist').upper()
-        title_u = (title or 'Greatest Hits').upper()
-
-        # Layout metrics (align text to photo margins)
-        margin_x = px
-        margin_top = int(height * 0.045)
-        spacing_head = 2
-        spacing_body = 1
-        # Fixed photo anchor: keep photo in a stable vertical position regardless of title length
-        photo_top_y = int(height * 0.14)
-        # Reserve vertical band for title between margin_top and photo_top_y
-        title_band_top = margin_top
-        title_band_bottom = photo_top_y
-        title_band_height = max(1, title_band_bottom - title_band_top)
-        title_box_w = width - 2*margin_x
-
-        def _measure_spaced_width(text, font, spacing):
-            td = ImageDraw.Draw(Image.new('RGB', (1,1)))
-            total = 0
-            for i, ch in enumerate(text):
-                ch_w = td.textbbox((0,0), ch, font=font)[2]
-                total += ch_w
-                if i != len(text)-1:
-                    total += spacing
-            return max(total, 1)
-
-        # Fit heading font to available width AND height of the reserved title band
-        def fit_font_band(candidates, text, box_w, band_h, spacing_px, start_size, min_size):
-            size = start_size
-            while size >= min_size:
-                f = _load_font(candidates, size)
-                tw = _measure_spaced_width(text, f, spacing_px)
-                try:
-                    ascent, descent = f.getmetrics()
-                except Exception:
-                    ascent, descent = f.size, int(f.size * 0.25)
-                fudge = int(f.size * 0.35)
-                th = ascent + descent + fudge
-                if tw <= box_w and th <= band_h:
-                    return f
-                size -= 1
-            return _load_font(candidates, min_size)
-
-        heading_font = fit_font_band(
-            [
-                'impact.ttf', 'ariblk.ttf', 'arialbd.ttf',
-                'bahnschrift.ttf', 'segoeuib.ttf',
-                'Poppins-Black.ttf', 'Poppins-Black.otf',
-                'Poppins-ExtraBold.ttf', 'Poppins-ExtraBold.otf'
-            ],
-            title_u,
-            box_w=title_box_w,
-            band_h=title_band_height,
-            spacing_px=spacing_head,
-            start_size=int(width*0.16),
-            min_size=int(width*0.04)
-        )
-        sub_font = _load_font(['bahnschrift.ttf', 'arialbd.ttf', 'segoeui.ttf'], int(width * 0.045))
-
-        # Album title occupies the band; bottom-align to touch the photo
-        ty = title_band_bottom  # we will subtract title image height later for bottom alignment
-        # Measure width with custom letter spacing
-        tw = _measure_spaced_width(title_u, heading_font, spacing_head)
-        # Compute text metrics and add generous descent padding to prevent cut-off
-        # Use a direct bounding box height for reliability with multi-word titles
-        bbox_full = draw.textbbox((0,0), title_u, font=heading_font)
-        raw_h = bbox_full[3] - bbox_full[1]
-        # Padding accounts for stroke, potential overshoot glyphs, and spacing artifacts
-        stroke_w = max(1, heading_font.size // 16)
-        pad_extra = int(heading_font.size * 0.28) + stroke_w * 2
-        th = max(1, raw_h + pad_extra)
-        # Outline settings: contrasting color and safe padding to avoid clipping
-        def _lum(c):
-            r,g,b = c
-            return 0.299*r + 0.587*g + 0.114*b
-        outline_color = (0,0,0) if _lum(title_color) > 150 else (255,255,255)
-        stroke_w = max(1, heading_font.size // 16)
-        pad_outline = stroke_w + heading_font.size//12 + 4
-        title_img = Image.new('RGBA', (tw + pad_outline*2, th + pad_outline*2), (0,0,0,0))
-        tdraw = ImageDraw.Draw(title_img)
-        _draw_text_with_spacing(
-            tdraw,
-            (pad_outline, pad_outline),
-            title_u,
-            heading_font,
-            title_color,
-            spacing=spacing_head,
-            stroke_width=stroke_w,
-            stroke_fill=outline_color
-        )
-        # Post-render padding expansion if any stroke touches edges (edge scan to avoid clipping)
-        edge_bbox = title_img.getbbox()
-        if edge_bbox:
-            left, top, right, bottom = edge_bbox
-            needs_expand = left <= 1 or top <= 1 or right >= title_img.size[0]-2 or bottom >= title_img.size[1]-2
-            if needs_expand:
-                extra = max(6, heading_font.size//10 + 4)
-                expanded = Image.new('RGBA', (title_img.size[0] + extra*2, title_img.size[1] + extra*2), (0,0,0,0))
-                expanded.paste(title_img, (extra, extra))
-                title_img = expanded
-        # Post-render scaling (same idea as vertical artist scaling) to ensure title fits inside frame
-        frame_pad = max(6, width//100)
-        allowed_w = width - 2*frame_pad
-        if title_img.size[0] > allowed_w:
-            scale = allowed_w / title_img.size[0]
-            new_w = allowed_w
-            new_h = max(1, int(title_img.size[1] * scale))
-            title_img = title_img.resize((new_w, new_h), resample=Image.Resampling.LANCZOS)
-        # Center align title horizontally
-        tx = (width - title_img.size[0]) // 2
-        # Adjust vertical position so title bottom touches the fixed photo top
-        ty_adjusted = ty - title_img.size[1]
-        poster.paste(title_img, (tx, ty_adjusted), title_img)
-
-        # Place the square photo at fixed anchor (independent of title height)
-        py = photo_top_y
-        poster.paste(photo, (px, py))
-
-        # Thin rule under the photo
-        rule_y = py + photo_side + int(height*0.02)
-        draw.line([(margin_x, rule_y), (width - margin_x, rule_y)], fill=cream, width=max(1, width//400))
-
-        # Artist name vertically on both sides, scaled to fit from photo top to bottom frame
-        def fit_vertical_font(text, target_h, start_size, min_size):
-            size = start_size
-            # Lock artist font to Bahnschrift for consistency
-            candidates = ['bahnschrift.ttf']
-            while size >= min_size:
-                f = _load_font(candidates, size)
-                t_w = draw.textbbox((0,0), text, font=f)[2]
-                # Add padding fudge so rotation doesn't clip
-                pad_fudge = max(4, size // 6)
-                if (t_w + 2*pad_fudge) <= target_h:
-                    return f
-                size -= 1
-            return _load_font(candidates, min_size)
-
-        pad = max(6, width//100)
-        # Constrain vertical text to not go above the photo top
-        target_h = (height - pad) - py
-        art_font = fit_vertical_font(artist_u, target_h, start_size=int(width*0.1), min_size=max(14, int(width*0.02)))
-        # Ensure album title remains the largest text
-        if art_font.size >= heading_font.size:
-            safe_size = max(10, heading_font.size - 2)
-            art_font = _load_font(['bahnschrift.ttf','arialbd.ttf','segoeuib.ttf','impact.ttf'], safe_size)
-
-        # Render horizontal then rotate for each side
-        tw_bbox = draw.textbbox((0,0), artist_u, font=art_font)
-        base_w = tw_bbox[2] - tw_bbox[0]
-        base_h = tw_bbox[3] - tw_bbox[1]
-        pad_v = max(4, art_font.size // 6)
-        base_img = Image.new('RGBA', (base_w + 2*pad_v, base_h + 2*pad_v), (0,0,0,0))
-        bdraw = ImageDraw.Draw(base_img)
-        bdraw.text((pad_v, pad_v), artist_u, font=art_font, fill=text_color)
-
-        allowed_h = height - pad - py
-
-        def _stack_vertical(text, font, color, allowed_height):
-            # Determine per-character font size if needed for stacking.
-            chars = list(text)
-            size = font.size
-            line_gap_factor = 1.05
-            # If current size too big, reduce until fits.
-            while size > 8:
-                f = _load_font(['bahnschrift.ttf'], size)
-                line_h = int(size * line_gap_factor)
-                total_h = len(chars) * line_h
-                if total_h <= allowed_height:
-                    font_final = f
-                    break
-                size -= 1
-            else:
-                font_final = _load_font(['bahnschrift.ttf'], size)
-                line_h = int(size * line_gap_factor)
-                total_h = len(chars) * line_h
-            img_w = max(draw.textbbox((0,0), 'W', font=font_final)[2], int(font_final.size*0.8)) + 4
-            img_h = total_h + 4
-            v_img = Image.new('RGBA', (img_w, img_h), (0,0,0,0))
-            v_draw = ImageDraw.Draw(v_img)
-            y_cursor = 2
-            for ch in chars:
-                v_draw.text((2, y_cursor), ch, font=font_final, fill=color)
-                y_cursor += line_h
-            return v_img
-
-        # Rotated approach first
-        left_rot = base_img.rotate(90, resample=Image.Resampling.BICUBIC, expand=True)
-        right_rot = base_img.rotate(-90, resample=Image.Resampling.BICUBIC, expand=True)
-
-        need_stack = False
-        if left_rot.size[1] > allowed_h:
-            scale = allowed_h / left_rot.size[1]
-            # If scale is very small, stacked vertical characters will be clearer.
-            if scale < 0.6:
-                need_stack = True
-            else:
-                left_rot = left_rot.resize((max(1, int(left_rot.size[0]*scale)), allowed_h), resample=Image.Resampling.LANCZOS)
-                right_rot = right_rot.resize((max(1, int(right_rot.size[0]*scale)), allowed_h), resample=Image.Resampling.LANCZOS)
-
-        if need_stack:
-            left_vert = _stack_vertical(artist_u, art_font, text_color, allowed_h)
-            right_vert = _stack_vertical(artist_u, art_font, text_color, allowed_h)
-        else:
-            left_vert = left_rot
-            right_vert = right_rot
-
-        # Paste left (bottom-to-top visual style retained by rotation; stacked version already vertical)
-        l_x = pad + int(width*0.006)
-        l_y = py
-        poster.paste(left_vert, (l_x, l_y), left_vert)
-
-        # Paste right
-        r_x = width - pad - int(width*0.006) - right_vert.size[0]
-        r_y = py
-        poster.paste(right_vert, (r_x, r_y), right_vert)
-
-        # Tracklist block: fixed areas for tracks (left) and liner notes (right)
-        if tracks is None:
-            # Fallback: try to derive tracks locally
+    # Text layout is always Californication-style typography:
+    # uppercase artist and album for a clean poster hierarchy
+    artist_u = (artist or 'The Artist').upper()
+    title_u = (title or 'Greatest Hits').upper()
+
+    # Layout metrics (align text to photo margins)
+    margin_x = px
+    margin_top = int(height * 0.045)
+    spacing_head = 2
+    # Fixed photo anchor: keep photo in a stable vertical position regardless of title length
+    photo_top_y = int(height * 0.14)
+    # Reserve vertical band for title between margin_top and photo_top_y
+    title_band_top = margin_top
+    title_band_bottom = photo_top_y
+    title_band_height = max(1, title_band_bottom - title_band_top)
+    title_box_w = width - 2*margin_x
+    frame_pad = max(6, width//100)
+
+    # Fit heading font to available width AND height of the reserved title band
+    def fit_font_band(candidates, text, box_w, band_h, spacing_px, start_size, min_size):
+        def extents(size):
+            f = _load_font(candidates, size)
+            tw = _measure_spaced_width(text, f, spacing_px)
             try:
-                local_tracks = generate_album_content(pet_info).get('track_list', [])
+                ascent, descent = f.getmetrics()
             except Exception:
-                local_tracks = []
-        else:
-            local_tracks = tracks
+                ascent, descent = f.size, int(f.size * 0.25)
+            fudge = int(f.size * 0.35)
+            return tw, ascent + descent + fudge
+
+        def fits(size):
+            tw, th = extents(size)
+            return tw <= box_w and th <= band_h
+
+        with span('font_fit_title'):
+            ref_w, ref_h = extents(start_size)
+            guess = _predict_size(start_size, box_w / ref_w, band_h / max(1, ref_h))
+            return _font_spec(candidates, _fit_size(fits, start_size, min_size, guess))
+
+    heading_spec = fit_font_band(
+        _TITLE_FONTS,
+        title_u,
+        box_w=title_box_w,
+        band_h=title_band_height,
+        spacing_px=spacing_head,
+        start_size=int(width*0.16),
+        min_size=int(width*0.04)
+    )
+    heading_font = _plan_font(heading_spec)
+
+    # Album title occupies the band; its canvas is bottom-aligned to touch the photo.
+    # Measure width with custom letter spacing
+    tw = _measure_spaced_width(title_u, heading_font, spacing_head)
+    # Compute text metrics and add generous descent padding to prevent cut-off
+    # Use a direct bounding box height for reliability with multi-word titles
+    bbox_full = draw.textbbox((0,0), title_u, font=heading_font)
+    raw_h = bbox_full[3] - bbox_full[1]
+    # Padding accounts for stroke, potential overshoot glyphs, and spacing artifacts
+    stroke_w = max(1, heading_font.size // 16)
+    pad_extra = int(heading_font.size * 0.28) + stroke_w * 2
+    th = max(1, raw_h + pad_extra)
+    # Safe padding around the outline to avoid clipping
+    pad_outline = stroke_w + heading_font.size//12 + 4
+    title_plan = {
+        'text': title_u,
+        'font': heading_spec,
+        'spacing': spacing_head,
+        'stroke_width': stroke_w,
+        'pad': pad_outline,
+        'canvas': [tw + pad_outline*2, th + pad_outline*2],
+        # Edge-scan expansion step if the rendered stroke touches the canvas edge
+        'expand': max(6, heading_font.size//10 + 4),
+        'bottom': title_band_bottom,
+        # Post-render scaling keeps the title inside the frame
+        'max_width': width - 2*frame_pad,
+    }
 
-        # Normalize track titles and numbers (01., 02., ...)
-        norm_tracks = []
-        for i, t in enumerate(local_tracks, start=1):
-            try:
-                # Remove any existing numbering
-                title_part = t.split('. ', 1)[1]
-            except Exception:
-                title_part = t
-            norm_tracks.append((i, title_part.upper()))
-
-        tracklist_end_y = rule_y
-        notes_end_y = rule_y
-        if norm_tracks:
-            col_count = 2 if len(norm_tracks) >= 7 else 1
-            inner_w = width - 2 * margin_x
-            gap = int(width * 0.04)
-            tracks_w = inner_w
-
-            # Tracks area rectangle
-            t_area_x = margin_x
-            t_area_y = rule_y + int(height * 0.02)
-            t_area_w = tracks_w
-            t_area_h = height - max(6, width//100) - t_area_y
-
-            # Determine rows per column and fit font by width AND height
-            rows = (len(norm_tracks)+1)//2 if col_count == 2 else len(norm_tracks)
-            longest = max((tt for _, tt in norm_tracks), key=lambda t: len(t)) if norm_tracks else ""
-
-            def fit_track_fonts_box(start_size, min_size):
-                size = start_size
-                while size >= min_size:
-                    bf = _load_font(['segoeui.ttf', 'arial.ttf'], size)
-                    nf = _load_font(['bahnschrift.ttf', 'arialbd.ttf', 'segoeui.ttf'], max(int(size*1.08), int(width*0.028)))
-                    num_w = draw.textbbox((0,0), "00. ", font=nf)[2]
-                    col_w = (t_area_w - (gap if col_count == 2 else 0)) // col_count
-                    avail = col_w - num_w - int(width*0.01)
-                    lw = draw.textbbox((0,0), longest, font=bf)[2]
-                    line_h = int(bf.size * 1.5)
-                    need_h = rows * line_h
-                    if lw <= avail and need_h <= t_area_h:
-                        return bf, nf, line_h
-                    size -= 1
-                bf = _load_font(['segoeui.ttf','arial.ttf'], min_size)
-                nf = _load_font(['bahnschrift.ttf','arialbd.ttf','segoeui.ttf'], int(min_size*1.08))
-                return bf, nf, int(bf.size*1.5)
-
-            body_font, num_font, line_h = fit_track_fonts_box(int(width*0.035), int(width*0.02))
-            # Cap track fonts so title remains the biggest
-            if body_font.size >= heading_font.size:
-                new_size = max(10, heading_font.size - 2)
-                body_font = _load_font(['segoeui.ttf','arial.ttf'], new_size)
-                num_font = _load_font(['bahnschrift.ttf','arialbd.ttf','segoeui.ttf'], max(int(new_size*1.08), int(width*0.028)))
-                line_h = int(body_font.size * 1.5)
-
-            for idx, (num, tt) in enumerate(norm_tracks):
-                if col_count == 2:
-                    col = 0 if idx < (len(norm_tracks)+1)//2 else 1
-                    row = idx if col == 0 else idx - (len(norm_tracks)+1)//2
-                else:
-                    col, row = 0, idx
-                col_w = (t_area_w - (gap if col_count == 2 else 0)) // col_count
-                x = t_area_x + col * (col_w + gap)
-                y = t_area_y + row * line_h
-                num_txt = f"{num:02d}. "
-                draw.text((x, y), num_txt, font=num_font, fill=text_color)
-                nx = x + draw.textbbox((0,0), num_txt, font=num_font)[2]
-                draw.text((nx, y), tt, font=body_font, fill=text_color)
-                # Collect clickable region for this track if requested
-                if track_boxes is not None:
-                    # Region spans the whole line area for easier clicking
-                    track_boxes.append({
-                        'index': num - 1,
-                        'x': x,
-                        'y': y,
-                        'w': col_w,
-                        'h': line_h
-                    })
-
-            tracklist_end_y = t_area_y + rows * line_h
-
-        # Liner notes under tracklist (ensure visible and non-overlapping)
-        notes = (pet_info.get('liner_notes') or '').strip()
-        if notes:
-            def _wrap_text(draw_ctx, text, font_obj, max_w):
-                words = text.split()
-                lines, current = [], ''
-                for w in words:
-                    test = (current + ' ' + w).strip()
-                    tw = draw_ctx.textbbox((0,0), test, font=font_obj)[2]
-                    if tw <= max_w:
-                        current = test
-                    else:
-                        if current:
-                            lines.append(current)
-                        current = w
-                if current:
-                    lines.append(current)
-                return lines
-
-            # Dynamically fit notes font to available height to ensure visibility
-            def fit_notes_font(start_size, min_size, avail_height):
-                size = start_size
-                while size >= min_size:
-                    nf = _load_font(['segoeui.ttf', 'arial.ttf'], size)
-                    gap = int(nf.size * 1.4)
-                    # At least one line should fit
-                    if avail_height >= gap:
-                        return nf, gap
-                    size -= 1
-                nf = _load_font(['segoeui.ttf', 'arial.ttf'], min_size)
-                return nf, int(nf.size * 1.4)
-
-            # Liner notes removed: skip rendering and reserve no area
-            lines = []
-            available_h = 0
-
-            notes_font, line_gap = fit_notes_font(int(width * 0.03), int(width * 0.018), available_h)
-            # No notes to render
-            notes_end_y = tracklist_end_y
-
-        # Footer artist repetition removed to avoid duplicate artist text
-
-    # If not Californication style, use the existing vibe/energy layout
-    if not cali_typo:
-        # Font selection per vibe
-        font_title, font_artist = _fonts_for_vibe(vibe, title_size=64, artist_size=36)
-
-    # Energy affects casing and spacing/tilt
-        spacing = 0
-        title_draw = title
-        if energy == 'Zoomies Every Hour':
-            title_draw = title.upper()
-        elif energy == 'Chill':
-            title_draw = title.title()
-            spacing = 2
-
-        # Render title on its own layer if tilt is needed
-        needs_tilt = (energy == 'Zoomies Every Hour')
-        shadow = (0, 0, 0)
-        stroke_w = 2
-        stroke_c = shadow
-
-        if needs_tilt:
-            # Create transparent layer
-            layer = Image.new('RGBA', img.size, (0, 0, 0, 0))
-            layer_draw = ImageDraw.Draw(layer)
-            tw, th = layer_draw.textbbox((0, 0), title_draw, font=font_title)[2:]
-            tx = (size - tw) // 2
-            ty = int(size * 0.07)
-            _draw_text_with_spacing(layer_draw, (tx+2, ty+2), title_draw, font_title, shadow, spacing=spacing, stroke_width=stroke_w, stroke_fill=stroke_c)
-            _draw_text_with_spacing(layer_draw, (tx, ty), title_draw, font_title, (0, 0, 0), spacing=spacing, stroke_width=stroke_w, stroke_fill=stroke_c)
-            layer = layer.rotate(-4, resample=Image.Resampling.BICUBIC, center=(size//2, int(size*0.15)), expand=False)
-            img = Image.alpha_composite(img.convert('RGBA'), layer).convert('RGB')
-            draw = ImageDraw.Draw(img)
+    # Place the square photo at fixed anchor (independent of title height)
+    py = photo_top_y
+
+    # Thin rule under the photo
+    rule_y = py + photo_side + int(height*0.02)
+
+    # Artist name vertically on both sides, scaled to fit from photo top to bottom frame
+    def fit_vertical_font(text, target_h, start_size, min_size):
+        candidates = _ARTIST_FONTS
+
+        def text_w(size):
+            return draw.textbbox((0,0), text, font=_load_font(candidates, size))[2]
+
+        def fits(size):
+            # Add padding fudge so rotation doesn't clip
+            pad_fudge = max(4, size // 6)
+            return (text_w(size) + 2*pad_fudge) <= target_h
+
+        with span('font_fit_artist'):
+            guess = _predict_size(start_size, target_h / max(1, text_w(start_size) + 2*max(4, start_size // 6)))
+            return _font_spec(candidates, _fit_size(fits, start_size, min_size, guess))
+
+    pad = frame_pad
+    # Constrain vertical text to not go above the photo top
+    target_h = (height - pad) - py
+    art_spec = fit_vertical_font(artist_u, target_h, start_size=int(width*0.1), min_size=max(14, int(width*0.02)))
+    art_font = _plan_font(art_spec)
+    # Ensure album title remains the largest text
+    if art_font.size >= heading_font.size:
+        art_spec = _font_spec(_ARTIST_SAFE_FONTS, max(10, heading_font.size - 2))
+        art_font = _plan_font(art_spec)
+
+    # Rendered horizontally then rotated for each side
+    tw_bbox = draw.textbbox((0,0), artist_u, font=art_font)
+    base_w = tw_bbox[2] - tw_bbox[0]
+    base_h = tw_bbox[3] - tw_bbox[1]
+    pad_v = max(4, art_font.size // 6)
+    allowed_h = height - pad - py
+    # A 90 degree rotation swaps the axes of the padded horizontal canvas
+    rot_w, rot_h = base_h + 2*pad_v, base_w + 2*pad_v
+
+    def _stack_vertical_layout(text, font_size, allowed_height):
+        # Determine per-character font size if needed for stacking.
+        chars = list(text)
+        size = font_size
+        line_gap_factor = 1.05
+        # If current size too big, reduce until fits (no font loads needed to check).
+        def fits(sz):
+            return len(chars) * int(sz * line_gap_factor) <= allowed_height
+        if size > 8 and not fits(size):
+            with span('font_fit_artist'):
+                size = _fit_size(fits, size - 1, 9, guess=allowed_height / max(1, len(chars) * line_gap_factor))
+            if not fits(size):
+                size = 8
+        spec = _font_spec(_ARTIST_FONTS, size)
+        font_final = _plan_font(spec)
+        line_h = int(size * line_gap_factor)
+        total_h = len(chars) * line_h
+        img_w = max(draw.textbbox((0,0), 'W', font=font_final)[2], int(font_final.size*0.8)) + 4
+        return spec, line_h, [img_w, total_h + 4]
+
+    artist_plan = {'text': artist_u, 'font': art_spec, 'mode': 'rotate', 'pad': pad_v,
+                   'base_size': [base_w + 2*pad_v, base_h + 2*pad_v], 'size': [rot_w, rot_h]}
+    if rot_h > allowed_h:
+        scale = allowed_h / rot_h
+        # If scale is very small, stacked vertical characters will be clearer.
+        if scale < 0.6:
+            stack_spec, stack_line_h, stack_size = _stack_vertical_layout(artist_u, art_font.size, allowed_h)
+            artist_plan.update({'mode': 'stack', 'font': stack_spec, 'line_h': stack_line_h, 'size': stack_size})
         else:
-            tw, th = draw.textbbox((0, 0), title_draw, font=font_title)[2:]
-            tx = (width - tw) // 2
-            ty = int(height * 0.07)
-            _draw_text_with_spacing(draw, (tx+2, ty+2), title_draw, font_title, shadow, spacing=spacing, stroke_width=stroke_w, stroke_fill=stroke_c)
-            _draw_text_with_spacing(draw, (tx, ty), title_draw, font_title, (0, 0, 0), spacing=spacing, stroke_width=stroke_w, stroke_fill=stroke_c)
-
-        # Artist position (bottom center)
-        aw, ah = draw.textbbox((0, 0), artist, font=font_artist)[2:]
-        ax = (width - aw) // 2
-        ay = int(height * 0.86)
-        draw.text((ax+1, ay+1), artist, font=font_artist, fill=shadow, stroke_width=1, stroke_fill=shadow)
-        draw.text((ax, ay), artist, font=font_artist, fill=(0, 0, 0), stroke_width=1, stroke_fill=shadow)
-
-    # Optional stickers based on traits (minimal, simple icons)
-    # Pick a sticker font that exists in both branches
-    if 'cali_typo' in locals() and cali_typo:
-        sticker_font = _load_font(['bahnschrift.ttf', 'arialbd.ttf', 'segoeui.ttf'], int(width * 0.04))
-    else:
-        # fallback to artist font if available
-        try:
-            sticker_font = font_artist
-        except NameError:
-            sticker_font = _load_font(['arialbd.ttf', 'segoeui.ttf', 'arial.ttf'], int(width * 0.04))
-    stickers = []
-    if pet_info.get('vocalness_description') == 'Opera' or pet_info.get('sneakiness') == 'Master thief':
-        stickers.append('Deluxe')
-    if pet_info.get('wingman_activity') == 'Park meetups':
-        stickers.append('Live at the Park')
-    if pet_info.get('wingman_activity') in ('People-watching', 'Bird TV'):
-        stickers.append('Window Sessions')
+            artist_plan['size'] = [max(1, int(rot_w*scale)), allowed_h]
+    vert_w = artist_plan['size'][0]
+    # Left (bottom-to-top visual style retained by rotation; stacked version already vertical) and right
+    artist_plan['left'] = [pad + int(width*0.006), py]
+    artist_plan['right'] = [width - pad - int(width*0.006) - vert_w, py]
+
+    # Tracklist block: fixed area for tracks under the rule
+    norm_tracks = [(i, tt.upper()) for i, tt in enumerate(track_titles, start=1)]
+    tracks_plan = None
+    track_boxes = []
+    tracklist_end_y = rule_y
+    if norm_tracks:
+        col_count = 2 if len(norm_tracks) >= 7 else 1
+        inner_w = width - 2 * margin_x
+        gap = int(width * 0.04)
+        tracks_w = inner_w
+
+        # Tracks area rectangle
+        t_area_x = margin_x
+        t_area_y = rule_y + int(height * 0.02)
+        t_area_w = tracks_w
+        t_area_h = height - max(6, width//100) - t_area_y
+
+        # Determine rows per column and fit font by width AND height
+        rows = (len(norm_tracks)+1)//2 if col_count == 2 else len(norm_tracks)
+        longest = max((tt for _, tt in norm_tracks), key=lambda t: len(t)) if norm_tracks else ""
+        col_w = (t_area_w - (gap if col_count == 2 else 0)) // col_count
+
+        def fit_track_fonts_box(start_size, min_size):
+            def measure(size):
+                bf = _load_font(_TRACK_BODY_FONTS, size)
+                nf = _load_font(_TRACK_NUM_FONTS, max(int(size*1.08), int(width*0.028)))
+                num_w = draw.textbbox((0,0), "00. ", font=nf)[2]
+                avail = col_w - num_w - int(width*0.01)
+                lw = draw.textbbox((0,0), longest, font=bf)[2]
+                line_h = int(bf.size * 1.5)
+                return bf, nf, line_h, lw, avail
+
+            def fits(size):
+                _, _, line_h, lw, avail = measure(size)
+                return lw <= avail and rows * line_h <= t_area_h
+
+            with span('font_fit_tracks'):
+                _, _, ref_line_h, ref_lw, ref_avail = measure(start_size)
+                guess = _predict_size(start_size, ref_avail / max(1, ref_lw), t_area_h / max(1, rows * ref_line_h))
+                size = _fit_size(fits, start_size, min_size, guess)
+            if fits(size):
+                return size, max(int(size*1.08), int(width*0.028))
+            return min_size, int(min_size*1.08)
+
+        body_size, num_size = fit_track_fonts_box(int(width*0.035), int(width*0.02))
+        # Cap track fonts so title remains the biggest
+        if _load_font(_TRACK_BODY_FONTS, body_size).size >= heading_font.size:
+            body_size = max(10, heading_font.size - 2)
+            num_size = max(int(body_size*1.08), int(width*0.028))
+        body_spec = _font_spec(_TRACK_BODY_FONTS, body_size)
+        num_spec = _font_spec(_TRACK_NUM_FONTS, num_size)
+        num_font = _plan_font(num_spec)
+        line_h = int(_plan_font(body_spec).size * 1.5)
+
+        lines = []
+        for idx, (num, tt) in enumerate(norm_tracks):
+            if col_count == 2:
+                col = 0 if idx < (len(norm_tracks)+1)//2 else 1
+                row = idx if col == 0 else idx - (len(norm_tracks)+1)//2
+            else:
+                col, row = 0, idx
+            x = t_area_x + col * (col_w + gap)
+            y = t_area_y + row * line_h
+            num_txt = f"{num:02d}. "
+            nx = x + draw.textbbox((0,0), num_txt, font=num_font)[2]
+            lines.append({'num': num_txt, 'num_xy': [x, y], 'title': tt, 'title_xy': [nx, y]})
+            # Clickable region spans the whole line area for easier clicking
+            track_boxes.append({
+                'index': num - 1,
+                'x': x,
+                'y': y,
+                'w': col_w,
+                'h': line_h
+            })
+        tracks_plan = {'body_font': body_spec, 'num_font': num_spec, 'line_h': line_h, 'lines': lines}
+        tracklist_end_y = t_area_y + rows * line_h
 
-    # Move stickers to bottom-right and stack upward to avoid overlap with tracklist
+    # Stickers go bottom-right and stack upward to avoid overlap with the tracklist
+    sticker_spec = _font_spec(_STICKER_FONTS, int(width * 0.04))
+    sticker_font = _plan_font(sticker_spec)
     sx_right = width - margin_x
-    # Place stickers below notes area to avoid overlap; keep within bottom frame
-    pad2 = max(6, width//100)
-    sy = max(int(height * 0.92), locals().get('tracklist_end_y', int(height*0.85)) + int(height * 0.04))
-    sy = min(sy, height - pad2 - int(sticker_font.size))
+    # Keep within bottom frame
+    sy = max(int(height * 0.92), tracklist_end_y + int(height * 0.04))
+    sy = min(sy, height - frame_pad - int(sticker_font.size))
+    sticker_items = []
     for s in stickers[:2]:
-        # Draw sticker text only (no box), right-aligned
+        # Sticker text only (no box), right-aligned
         sw, sh = draw.textbbox((0, 0), s, font=sticker_font)[2:]
-        tx = sx_right - sw
-        draw.text((tx, sy), s, font=sticker_font, fill=text_color)
+        sticker_items.append({'text': s, 'xy': [sx_right - sw, sy]})
         sy -= sh + 12
 
-    # Save
-    # Optional frame for poster mode
-    if poster_mode:
-        frame = Image.new('RGBA', poster.size, (0,0,0,0))
-        fdraw = ImageDraw.Draw(frame)
-        border_color = (245, 240, 225)
-        pad = max(6, width//100)
-        fdraw.rectangle([pad, pad, width-pad, height-pad], outline=border_color, width=pad//2)
-        poster = Image.alpha_composite(poster.convert('RGBA'), frame).convert('RGB')
-
-    filename = f"cover_{int(time.time())}_{random.randint(1000,9999)}.jpg"
-    out_path = os.path.join(out_dir, filename)
-    poster.save(out_path, quality=90)
-    return filename, width, height
+    return {
+        'width': width,
+        'height': height,
+        'photo': {'x': px, 'y': py, 'side': photo_side},
+        'title': title_plan,
+        'rule': {'y': rule_y, 'x0': margin_x, 'x1': width - margin_x, 'width': max(1, width//400)},
+        'artist': artist_plan,
+        'tracks': tracks_plan,
+        'track_boxes': track_boxes,
+        'stickers': {'font': sticker_spec, 'items': sticker_items},
+        'frame': {'pad': frame_pad, 'width': frame_pad//2},
+    }
+
+def scale_cover_layout(plan, factor):
+    """Return a copy of a layout plan with every box, offset and font size scaled by factor.
+
+    Lets one fitted plan (e.g. from layout_cover(size=1024)) drive posters of
+    any size without re-running the font fitting.
+    """
+    def sc(v):
+        return int(round(v * factor))
+    def pt(xy):
+        return [sc(xy[0]), sc(xy[1])]
+    def font(spec):
+        return _font_spec(spec['candidates'], max(1, sc(spec['size'])))
+
+    title = plan['title']
+    artist = plan['artist']
+    scaled_artist = dict(artist, font=font(artist['font']), pad=sc(artist['pad']), left=pt(artist['left']), right=pt(artist['right']))
+    if artist['mode'] == 'stack':
+        scaled_artist.update(line_h=max(1, sc(artist['line_h'])), size=pt(artist['size']))
+    else:
+        base_w, base_h = pt(artist['base_size'])
+        scaled_artist['base_size'] = [base_w, base_h]
+        # An unsquashed rotation stays exactly the swapped base canvas, so no resample is needed
+        unsquashed = list(artist['size']) == [artist['base_size'][1], artist['base_size'][0]]
+        scaled_artist['size'] = [base_h, base_w] if unsquashed else pt(artist['size'])
+
+    tracks = plan['tracks']
+    if tracks:
+        tracks = {
+            'body_font': font(tracks['body_font']),
+            'num_font': font(tracks['num_font']),
+            'line_h': sc(tracks['line_h']),
+            'lines': [dict(line, num_xy=pt(line['num_xy']), title_xy=pt(line['title_xy'])) for line in tracks['lines']],
+        }
+
+    return {
+        'width': sc(plan['width']),
+        'height': sc(plan['height']),
+        'photo': {'x': sc(plan['photo']['x']), 'y': sc(plan['photo']['y']), 'side': sc(plan['photo']['side'])},
+        'title': dict(
+            title,
+            font=font(title['font']),
+            spacing=sc(title['spacing']),
+            stroke_width=max(1, sc(title['stroke_width'])),
+            pad=sc(title['pad']),
+            canvas=pt(title['canvas']),
+            expand=sc(title['expand']),
+            bottom=sc(title['bottom']),
+            max_width=sc(title['max_width']),
+        ),
+        'rule': {'y': sc(plan['rule']['y']), 'x0': sc(plan['rule']['x0']), 'x1': sc(plan['rule']['x1']),
+                 'width': max(1, sc(plan['rule']['width']))},
+        'artist': scaled_artist,
+        'tracks': tracks,
+        'track_boxes': [dict(box, x=sc(box['x']), y=sc(box['y']), w=sc(box['w']), h=sc(box['h'])) for box in plan['track_boxes']],
+        'stickers': {'font': font(plan['stickers']['font']),
+                     'items': [dict(item, xy=pt(item['xy'])) for item in plan['stickers']['items']]},
+        'frame': {'pad': sc(plan['frame']['pad']), 'width': sc(plan['frame']['width'])},
+    }
+
+def _darken_for_text(rgb, max_luma=150):
+    r, g, b = rgb
+    def lum(rr, gg, bb):
+        return 0.299*rr + 0.587*gg + 0.114*bb
+    # Darken towards black until sufficiently dark for contrast
+    for _ in range(8):
+        if lum(r, g, b) <= max_luma:
+            break
+        r = int(r * 0.85)
+        g = int(g * 0.85)
+        b = int(b * 0.85)
+    return (r, g, b)
+
+def _poster_colors(photo):
+    # Poster background and text colors derived from the treated photo's palette,
+    # extracted once and shared by every derived color
+    with span('dominant_color'):
+        palette = _extract_palette(photo)
+        dom = _dominant_color(photo, palette=palette)
+    title_color = dom
+    return {
+        'palette': palette,
+        'background': _lighten_for_background(dom),
+        'title': title_color,
+        # Outline settings: contrasting color for the title stroke
+        'outline': (0,0,0) if _luma(title_color) > 150 else (255,255,255),
+        'text': _darken_for_text(dom),
+        'rule': (245, 240, 225),
+        'frame': (245, 240, 225),
+    }
+
+def _render_title_layer(title_plan, color, outline_color):
+    cw, ch = title_plan['canvas']
+    pad_outline = title_plan['pad']
+    title_img = Image.new('RGBA', (cw, ch), (0,0,0,0))
+    tdraw = ImageDraw.Draw(title_img)
+    _draw_text_with_spacing(
+        tdraw,
+        (pad_outline, pad_outline),
+        title_plan['text'],
+        _plan_font(title_plan['font']),
+        color,
+        spacing=title_plan['spacing'],
+        stroke_width=title_plan['stroke_width'],
+        stroke_fill=outline_color
+    )
+    # Post-render padding expansion if any stroke touches edges (edge scan to avoid clipping)
+    edge_bbox = title_img.getbbox()
+    if edge_bbox:
+        left, top, right, bottom = edge_bbox
+        needs_expand = left <= 1 or top <= 1 or right >= title_img.size[0]-2 or bottom >= title_img.size[1]-2
+        if needs_expand:
+            extra = title_plan['expand']
+            expanded = Image.new('RGBA', (title_img.size[0] + extra*2, title_img.size[1] + extra*2), (0,0,0,0))
+            expanded.paste(title_img, (extra, extra))
+            title_img = expanded
+    # Post-render scaling (same idea as vertical artist scaling) to ensure title fits inside frame
+    allowed_w = title_plan['max_width']
+    if title_img.size[0] > allowed_w:
+        scale = allowed_w / title_img.size[0]
+        new_h = max(1, int(title_img.size[1] * scale))
+        title_img = title_img.resize((allowed_w, new_h), resample=Image.Resampling.LANCZOS)
+    return title_img
+
+def _render_artist_layers(artist_plan, color):
+    font = _plan_font(artist_plan['font'])
+    if artist_plan['mode'] == 'stack':
+        img_w, img_h = artist_plan['size']
+        v_img = Image.new('RGBA', (img_w, img_h), (0,0,0,0))
+        v_draw = ImageDraw.Draw(v_img)
+        y_cursor = 2
+        for ch in artist_plan['text']:
+            v_draw.text((2, y_cursor), ch, font=font, fill=color)
+            y_cursor += artist_plan['line_h']
+        return v_img, v_img
+    pad_v = artist_plan['pad']
+    base_img = Image.new('RGBA', tuple(artist_plan['base_size']), (0,0,0,0))
+    ImageDraw.Draw(base_img).text((pad_v, pad_v), artist_plan['text'], font=font, fill=color)
+    left_rot = base_img.rotate(90, resample=Image.Resampling.BICUBIC, expand=True)
+    right_rot = base_img.rotate(-90, resample=Image.Resampling.BICUBIC, expand=True)
+    size = tuple(artist_plan['size'])
+    if left_rot.size != size:
+        left_rot = left_rot.resize(size, resample=Image.Resampling.LANCZOS)
+        right_rot = right_rot.resize(size, resample=Image.Resampling.LANCZOS)
+    return left_rot, right_rot
+
+def _cover_layers(plan, colors):
+    # Text layers that are composited as images (title with outline, rotated artist)
+    with span('title'):
+        title_img = _render_title_layer(plan['title'], colors['title'], colors['outline'])
+    # Title bottom touches the fixed photo top; centered horizontally
+    title_xy = ((plan['width'] - title_img.size[0]) // 2, plan['title']['bottom'] - title_img.size[1])
+    with span('artist'):
+        left_vert, right_vert = _render_artist_layers(plan['artist'], colors['text'])
+    return {'title': (title_img, title_xy), 'artist': (left_vert, right_vert)}
+
+def _draw_cover_region(canvas, plan, colors, layers, photo, photo_y, origin_y=0):
+    """Draw the poster rows origin_y .. origin_y + canvas.height onto canvas.
+
+    canvas must already be filled with the background color. photo is the
+    (part of the) treated photo whose top row sits at poster row photo_y; pass
+    None when the photo does not intersect this region.
+    """
+    width, height = plan['width'], plan['height']
+    bottom = origin_y + canvas.size[1]
+    draw = ImageDraw.Draw(canvas)
+
+    def visible(y0, y1):
+        return y1 > origin_y and y0 < bottom
+
+    with span('composite'):
+        title_img, (tx, ty) = layers['title']
+        if visible(ty, ty + title_img.size[1]):
+            canvas.paste(title_img, (tx, ty - origin_y), title_img)
+
+        if photo is not None:
+            canvas.paste(photo, (plan['photo']['x'], photo_y - origin_y))
+
+        rule = plan['rule']
+        if visible(rule['y'] - rule['width'], rule['y'] + rule['width'] + 1):
+            draw.line([(rule['x0'], rule['y'] - origin_y), (rule['x1'], rule['y'] - origin_y)], fill=colors['rule'], width=rule['width'])
+
+        left_vert, right_vert = layers['artist']
+        for img, xy in ((left_vert, plan['artist']['left']), (right_vert, plan['artist']['right'])):
+            if visible(xy[1], xy[1] + img.size[1]):
+                canvas.paste(img, (xy[0], xy[1] - origin_y), img)
+
+    with span('tracklist'):
+        tracks_plan = plan['tracks']
+        if tracks_plan:
+            num_font = _plan_font(tracks_plan['num_font'])
+            body_font = _plan_font(tracks_plan['body_font'])
+            reach = max(tracks_plan['line_h'], num_font.size, body_font.size) * 2
+            for line in tracks_plan['lines']:
+                nx, ny = line['num_xy']
+                if not visible(ny - reach, ny + reach):
+                    continue
+                draw.text((nx, ny - origin_y), line['num'], font=num_font, fill=colors['text'])
+                draw.text((line['title_xy'][0], line['title_xy'][1] - origin_y), line['title'], font=body_font, fill=colors['text'])
+
+        sticker_font = _plan_font(plan['stickers']['font'])
+        for item in plan['stickers']['items']:
+            sx, sy = item['xy']
+            if visible(sy - sticker_font.size, sy + sticker_font.size * 2):
+                draw.text((sx, sy - origin_y), item['text'], font=sticker_font, fill=colors['text'])
+
+    # Frame (opaque outline, so it is drawn straight onto the poster)
+    with span('frame'):
+        pad = plan['frame']['pad']
+        draw.rectangle([pad, pad - origin_y, width-pad, height-pad - origin_y], outline=colors['frame'], width=plan['frame']['width'])
+
+def render_cover_layout(plan, photo, colors=None):
+    """Rasterize a layout plan from layout_cover() around an already treated square photo."""
+    if colors is None:
+        colors = _poster_colors(photo)
+    poster = Image.new('RGB', (plan['width'], plan['height']), colors['background'])
+    _draw_cover_region(poster, plan, colors, _cover_layers(plan, colors), photo, plan['photo']['y'])
+    return poster
+
+# Poster preset overlays
+VIGNETTE_CACHE_SIZE = int(os.environ.get('VIGNETTE_CACHE_SIZE', '16'))
+
+@functools.lru_cache(maxsize=VIGNETTE_CACHE_SIZE)
+def _vignette_masks(size, strength):
+    # The blurred ellipse depends only on (size, strength), so build it once and
+    # share the (read-only) mask and its inverse between requests
+    w, h = size
+    vignette = Image.new('L', (w, h), 0)
+    draw_v = ImageDraw.Draw(vignette)
+    draw_v.ellipse((int(-0.1*w), int(-0.2*h), int(1.1*w), int(1.2*h)), fill=int(255*strength))
+    vignette = vignette.filter(ImageFilter.GaussianBlur(radius=int(min(w, h)*0.08)))
+    return vignette, ImageOps.invert(vignette)
+
+def _apply_vignette(im, strength=0.5):
+    # Darkens im in place (callers pass a photo they own) and returns it
+    _, inverted = _vignette_masks(im.size, strength)
+    im.paste((0, 0, 0), (0, 0), inverted)
+    return im
+
+def warm_vignette_cache(poster_sizes=(1024,), strength=0.55):
+    """Prebuild vignette masks for the photo slot of the given poster sizes."""
+    for size in poster_sizes:
+        side = int(size * 0.78)
+        _vignette_masks((side, side), strength)
+
+def _apply_grain(im, opacity=24):
+    w, h = im.size
+    noise = Image.effect_noise((w, h), 8).convert('L')
+    noise_rgb = Image.merge('RGB', (noise, noise, noise))
+    return Image.blend(im, noise_rgb, opacity/255.0)
+
+def _apply_split_tint(photo):
+    # Subtle blue/orange split tint on the photo
+    w, h = photo.size
+    grad = Image.new('RGBA', (w, h), (0, 0, 0, 0))
+    gdraw = ImageDraw.Draw(grad)
+    for y in range(h):
+        t = y / h
+        r = int(255 * (1-t) * 0.2 + 255 * t * 0.8)
+        b = int(255 * (1-t) * 0.8 + 255 * t * 0.2)
+        gdraw.line([(0, y), (w, y)], fill=(r, 100, b, 30))
+    return Image.alpha_composite(photo.convert('RGBA'), grad).convert('RGB')
+
+def _treat_photo(photo, vibe, energy, style='melodrama'):
+    # Vibe, energy and style color stages run as one fused matrix; only the
+    # spatial effects (blur/sharpen before, gradient/grain/vignette after) are separate
+    spatial, stages, post = _photo_program(vibe, energy, style)
+    with span('vibe_filter'):
+        photo = _apply_color_program(photo, spatial, stages)
+    for op, *args in post:
+        with span(op):
+            if op == 'vignette':
+                photo = _apply_vignette(photo, strength=args[0])
+            elif op == 'grain':
+                photo = _apply_grain(photo, opacity=args[0])
+            elif op == 'gradient':
+                photo = _apply_split_tint(photo)
+    return photo
+
+# Uploads above this many pixels are not decoded (decompression-bomb guard);
+# the poster falls back to the solid background like a missing photo.
+MAX_PHOTO_PIXELS = int(os.environ.get('MAX_PHOTO_PIXELS', str(64_000_000)))
+
+def _load_photo(photo_path, side):
+    """Decode photo_path just large enough for a side x side cover crop.
+
+    JPEGs decode in draft mode at the smallest DCT scale (1/2, 1/4, 1/8) that
+    still covers the crop; other formats are box-reduced right after decoding,
+    keeping at least 2x headroom for the final LANCZOS fit. EXIF orientation is
+    applied. Returns None for missing, unreadable or oversized images.
+    """
+    if not photo_path or (isinstance(photo_path, str) and not os.path.exists(photo_path)):
+        return None
+    with span('decode'):
+        return _decode_photo(photo_path, side)
+
+def _decode_photo(photo_path, side):
+    try:
+        if hasattr(photo_path, 'seek'):
+            photo_path.seek(0)
+        im = Image.open(photo_path)
+        w, h = im.size
+        if w * h > MAX_PHOTO_PIXELS:
+            app.logger.warning("Ignoring %s: %dx%d exceeds MAX_PHOTO_PIXELS", photo_path, w, h)
+            return None
+        # Both sides stay >= side, so any EXIF rotation still covers the square crop
+        im.draft('RGB', (side, side))
+        ImageOps.exif_transpose(im, in_place=True)
+        if im.mode != 'RGB':
+            im = im.convert('RGB')
+        factor = min(im.size) // (side * 2)
+        if factor >= 2:
+            im = im.reduce(factor)
+        return im
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        app.logger.warning("Could not decode %s: %s", photo_path, e)
+        return None
+
+def _prepare_photo(photo_path, side, vibe, energy, style='melodrama'):
+    src = _load_photo(photo_path, side)
+    if src is None:
+        # fallback solid background
+        photo = Image.new('RGB', (side, side), (50, 70, 100))
+    else:
+        with span('fit'):
+            photo = ImageOps.fit(src, (side, side), method=Image.Resampling.LANCZOS, centering=(0.5, 0.5))
+    # Apply vibe and style to the photo only; background will be derived from photo palette
+    return _treat_photo(photo, vibe, energy, style)
+
+@profiled('generate_cover_image')
+def generate_cover_image(pet_info, photo_path=None, tracks=None, out_dir=None, size=1024, track_boxes=None, filename=None, as_bytes=False):
+    # Saved to poster_storage unless out_dir names a directory;
+    # as_bytes=True skips storage entirely: returns (BytesIO of the JPEG, width, height)
+    if tracks is None:
+        # Fallback: try to derive tracks locally
+        try:
+            tracks = generate_album_content(pet_info).get('track_list', [])
+        except Exception:
+            tracks = []
 
-def generate_album_content(pet_info):
+    plan = layout_cover(pet_info, tracks, size=size)
+    # Force single photo effect: melodrama only
+    photo = _prepare_photo(photo_path, plan['photo']['side'], pet_info.get('vibe'), pet_info.get('energy'), style='melodrama')
+    poster = render_cover_layout(plan, photo)
+    # Collect clickable regions for the tracks if requested
+    if track_boxes is not None:
+        track_boxes.extend(plan['track_boxes'])
+
+    if as_bytes:
+        buf = io.BytesIO()
+        with span('encode'):
+            poster.save(buf, 'JPEG', quality=90)
+        buf.seek(0)
+        return buf, plan['width'], plan['height']
+    if filename is None:
+        filename = f"cover_{int(time.time())}_{random.randint(1000,9999)}.jpg"
+    _save_jpeg(poster, filename, out_dir, quality=90)
+    return filename, plan['width'], plan['height']
+
+def _encode_jpeg(image, **params):
+    buf = io.BytesIO()
+    with span('encode'):
+        image.save(buf, 'JPEG', **params)
+    return buf.getbuffer()
+
+def _save_jpeg(image, filename, out_dir=None, **params):
+    if out_dir is None:
+        poster_storage.save(filename, _encode_jpeg(image, **params))
+        return
+    # Write then rename so a concurrent reader never sees a half-written poster
+    out_path = os.path.join(out_dir, filename)
+    tmp_path = f"{out_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with span('encode'):
+        image.save(tmp_path, 'JPEG', **params)
+    os.replace(tmp_path, out_path)
+
+# Export pyramid: 'width' variants are rasterized natively from the scaled
+# layout; 'derive' variants are reduced from an already rendered poster
+# ('crop': 'square' keeps the top width x width, i.e. title and photo).
+EXPORT_VARIANTS = {
+    'print': {'width': 2400, 'quality': 95, 'dpi': 300},
+    'retina': {'width': 2048, 'quality': 88},
+    'web': {'width': 1024, 'quality': 90},
+    'social': {'width': 1080, 'derive': 'retina', 'crop': 'square', 'quality': 90},
+    'thumb': {'width': 256, 'derive': 'web', 'quality': 85},
+}
+
+def generate_cover_variants(pet_info, photo_path=None, tracks=None, out_dir=None,
+                            variants=('web', 'retina', 'thumb', 'social', 'print'), base_size=1024, stem=None):
+    """Render several poster sizes from one layout pass and one photo treatment.
+
+    Returns {variant: {'filename', 'width', 'height', 'track_boxes'}}; track
+    boxes are only reported for uncropped variants.
+    """
+    if tracks is None:
+        try:
+            tracks = generate_album_content(pet_info).get('track_list', [])
+        except Exception:
+            tracks = []
+    unknown = set(variants) - set(EXPORT_VARIANTS)
+    if unknown:
+        raise ValueError(f"unknown export variants: {', '.join(sorted(unknown))}")
+
+    # Native renders needed, including sources of derived variants
+    native = {v for v in variants if 'derive' not in EXPORT_VARIANTS[v]}
+    native |= {EXPORT_VARIANTS[v]['derive'] for v in variants if 'derive' in EXPORT_VARIANTS[v]}
+
+    base_plan = layout_cover(pet_info, tracks, size=base_size)
+    plans = {v: scale_cover_layout(base_plan, EXPORT_VARIANTS[v]['width'] / base_size) for v in native}
+    # Treat the photo once at the largest size; smaller posters get a LANCZOS reduction of it
+    largest = max(native, key=lambda v: plans[v]['photo']['side'])
+    big_photo = _prepare_photo(photo_path, plans[largest]['photo']['side'], pet_info.get('vibe'), pet_info.get('energy'), style='melodrama')
+    colors = _poster_colors(big_photo)
+
+    posters = {}
+    for v in sorted(native, key=lambda v: -plans[v]['width']):
+        side = plans[v]['photo']['side']
+        photo = big_photo if big_photo.size[0] == side else big_photo.resize((side, side), Image.Resampling.LANCZOS)
+        posters[v] = render_cover_layout(plans[v], photo, colors)
+
+    stem = stem or f"cover_{int(time.time())}_{random.randint(1000,9999)}"
+    results = {}
+    writes = []
+    for v in variants:
+        spec = EXPORT_VARIANTS[v]
+        boxes = []
+        if 'derive' in spec:
+            src = posters[spec['derive']]
+            if spec.get('crop') == 'square':
+                src = src.crop((0, 0, src.width, src.width))
+            else:
+                boxes = scale_cover_layout(plans[spec['derive']], spec['width'] / src.width)['track_boxes']
+            image = src.resize((spec['width'], round(src.height * spec['width'] / src.width)), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        else:
+            image = posters[v]
+            boxes = plans[v]['track_boxes']
+        params = {'quality': spec['quality']}
+        if spec.get('dpi'):
+            params['dpi'] = (spec['dpi'], spec['dpi'])
+        filename = f"{stem}_{v}.jpg"
+        if out_dir is None:
+            # Encode here, write in the background while the next variant is prepared
+            writes.append(poster_storage.save_async(filename, _encode_jpeg(image, **params)))
+        else:
+            _save_jpeg(image, filename, out_dir, **params)
+        results[v] = {'filename': filename, 'width': image.width, 'height': image.height, 'track_boxes': boxes}
+    for future in writes:
+        future.result()
+    return results
+
+# --- Print rendering --------------------------------------------------------
+# Print posters are rasterized in horizontal strips of PRINT_STRIP_HEIGHT rows
+# and encoded as they go, so only one strip (plus the title and artist text
+# layers) is ever held in memory. The photo is treated once at no more than
+# PRINT_PHOTO_MAX_SIDE and each strip resamples just its band of it.
+PRINT_STRIP_HEIGHT = int(os.environ.get('PRINT_STRIP_HEIGHT', '256'))
+PRINT_PHOTO_MAX_SIDE = int(os.environ.get('PRINT_PHOTO_MAX_SIDE', '2048'))
+PRINT_MAX_PIXELS = int(os.environ.get('PRINT_MAX_PIXELS', str(100_000_000)))
+# Paper widths in millimetres; the 4:5 poster spans the paper width
+PRINT_PAPERS = {'a4': 210, 'a3': 297, 'a2': 420, 'letter': 215.9}
+PRINT_FORMATS = {'png': 'image/png', 'pdf': 'application/pdf', 'jpg': 'image/jpeg'}
+
+def print_width(paper='a3', dpi=300):
+    """Poster width in pixels for a paper size at the given resolution."""
+    return int(round(PRINT_PAPERS[paper] / 25.4 * dpi))
+
+def iter_print_strips(pet_info, photo_path=None, tracks=None, width=3508, strip_height=None, base_size=1024):
+    """Yield (plan, strip) pairs of RGB strips that top-to-bottom make up the poster."""
+    if tracks is None:
+        try:
+            tracks = generate_album_content(pet_info).get('track_list', [])
+        except Exception:
+            tracks = []
+    strip_height = strip_height or PRINT_STRIP_HEIGHT
+    plan = scale_cover_layout(layout_cover(pet_info, tracks, size=base_size), width / base_size)
+    side, px, py = plan['photo']['side'], plan['photo']['x'], plan['photo']['y']
+    photo = _prepare_photo(photo_path, min(side, PRINT_PHOTO_MAX_SIDE), pet_info.get('vibe'), pet_info.get('energy'), style='melodrama')
+    colors = _poster_colors(photo)
+    layers = _cover_layers(plan, colors)
+    src_scale = photo.size[0] / side
+
+    for y0 in range(0, plan['height'], strip_height):
+        y1 = min(plan['height'], y0 + strip_height)
+        strip = Image.new('RGB', (plan['width'], y1 - y0), colors['background'])
+        band, band_y = None, py
+        top, bottom = max(y0, py), min(y1, py + side)
+        if top < bottom:
+            # Resample only this band; the box keeps neighbouring rows in the filter support
+            box = (0, (top - py) * src_scale, photo.size[0], (bottom - py) * src_scale)
+            band = photo.resize((side, bottom - top), Image.Resampling.LANCZOS, box=box)
+            band_y = top
+        _draw_cover_region(strip, plan, colors, layers, band, band_y, origin_y=y0)
+        yield plan, strip
+
+def _png_chunk(tag, data):
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+def _iter_png(strips, width, height, dpi):
+    yield b'\x89PNG\r\n\x1a\n'
+    yield _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+    ppm = int(round(dpi / 0.0254))
+    yield _png_chunk(b'pHYs', struct.pack('>IIB', ppm, ppm, 1))
+    z = zlib.compressobj(6)
+    stride = width * 3
+    for strip in strips:
+        raw = strip.tobytes()
+        # Filter type 0 (None) per scanline
+        data = z.compress(b''.join(b'\x00' + raw[i:i + stride] for i in range(0, len(raw), stride)))
+        if data:
+            yield _png_chunk(b'IDAT', data)
+    yield _png_chunk(b'IDAT', z.flush())
+    yield _png_chunk(b'IEND', b'')
+
+def _iter_pdf(strips, width, height, dpi):
+    # Single page with one FlateDecode image; its /Length is an indirect object
+    # written after the stream, since the compressed size is unknown up front
+    page_w, page_h = width * 72 / dpi, height * 72 / dpi
+    offsets = {}
+    written = 0
+
+    def emit(num, body):
+        nonlocal written
+        offsets[num] = written
+        chunk = f"{num} 0 obj\n{body}\nendobj\n".encode('latin-1')
+        written += len(chunk)
+        return chunk
+
+    head = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+    written += len(head)
+    yield head
+    yield emit(1, '<< /Type /Catalog /Pages 2 0 R >>')
+    yield emit(2, '<< /Type /Pages /Kids [3 0 R] /Count 1 >>')
+    yield emit(3, f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_w:.2f} {page_h:.2f}] '
+                  f'/Resources << /XObject << /Im0 4 0 R >> >> /Contents 5 0 R >>')
+    content = f'q {page_w:.2f} 0 0 {page_h:.2f} 0 0 cm /Im0 Do Q'
+    yield emit(5, f'<< /Length {len(content)} >>\nstream\n{content}\nendstream')
+
+    offsets[4] = written
+    img_head = (f'4 0 obj\n<< /Type /XObject /Subtype /Image /Width {width} /Height {height} '
+                f'/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /FlateDecode /Length 6 0 R >>\nstream\n').encode('latin-1')
+    written += len(img_head)
+    yield img_head
+    z = zlib.compressobj(6)
+    length = 0
+    for strip in strips:
+        data = z.compress(strip.tobytes())
+        if data:
+            length += len(data)
+            written += len(data)
+            yield data
+    data = z.flush()
+    length += len(data)
+    tail = data + b'\nendstream\nendobj\n'
+    written += len(tail)
+    yield tail
+    yield emit(6, str(length))
+
+    xref = ['xref', '0 7', '0000000000 65535 f ']
+    xref += [f'{offsets[n]:010d} 00000 n ' for n in range(1, 7)]
+    yield ('\n'.join(xref) + f'\ntrailer\n<< /Size 7 /Root 1 0 R >>\nstartxref\n{written}\n%%EOF\n').encode('latin-1')
+
+def stream_print_poster(pet_info, photo_path=None, tracks=None, fmt='png', paper='a3', dpi=300):
+    """Yield the encoded print poster in chunks ('png', 'pdf' or 'jpg')."""
+    width = print_width(paper, dpi)
+    height = int(width * 1.25)
+    strips = (strip for _, strip in iter_print_strips(pet_info, photo_path, tracks, width=width))
+    if fmt == 'png':
+        yield from _iter_png(strips, width, height, dpi)
+    elif fmt == 'pdf':
+        yield from _iter_pdf(strips, width, height, dpi)
+    elif fmt == 'jpg':
+        # Pillow's JPEG encoder needs the whole image, so strips are assembled
+        # into a single canvas first (still no extra full-size layers)
+        poster = Image.new('RGB', (width, height))
+        y = 0
+        for strip in strips:
+            poster.paste(strip, (0, y))
+            y += strip.size[1]
+        buf = io.BytesIO()
+        poster.save(buf, 'JPEG', quality=95, dpi=(dpi, dpi))
+        del poster
+        yield buf.getvalue()
+    else:
+        raise ValueError(f"unsupported print format: {fmt}")
+
+# --- Render cache -----------------------------------------------------------
+# Posters for identical inputs are content-addressed: cover_<key>.jpg plus a
+# cover_<key>.json sidecar (dimensions, track boxes). The index is rebuilt from
+# the sidecars on first use, ordered by last access (file mtime), and evicted
+# LRU-first once the cached posters exceed RENDER_CACHE_MAX_BYTES (0 disables).
+RENDER_CACHE_MAX_BYTES = int(os.environ.get('RENDER_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+# Bump whenever poster rendering changes so stale cached posters are not served
+RENDER_VERSION = '2'
+
+_render_cache = None  # OrderedDict: key -> entry dict, least recently used first
+_render_cache_bytes = 0
+_render_cache_lock = threading.Lock()
+
+def _file_sha256(src, chunk_size=1024 * 1024):
+    # src is a path or an in-memory file from MemoryStorage.source()
+    if hasattr(src, 'getvalue'):
+        return hashlib.sha256(src.getvalue()).hexdigest()
+    h = hashlib.sha256()
+    with open(src, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def render_cache_key(pet_info, tracks, photo_hash=None, size=1024, style='melodrama'):
+    """Stable hash of everything that determines the rendered poster."""
+    normalized = {}
+    for k, v in pet_info.items():
+        if isinstance(v, str):
+            v = v.strip()
+        if v in (None, ''):
+            continue
+        normalized[k] = v
+    payload = {
+        'version': RENDER_VERSION,
+        'pet_info': normalized,
+        'tracks': list(tracks or []),
+        'photo': photo_hash,
+        'size': size,
+        'style': style,
+    }
+    blob = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()[:32]
+
+def _render_cache_names(key):
+    return f"cover_{key}.jpg", f"cover_{key}.json"
+
+def _load_render_cache():
+    # Caller holds _render_cache_lock
+    global _render_cache, _render_cache_bytes
+    entries = []
+    for name in poster_storage.list():
+        if not (name.startswith('cover_') and name.endswith('.json')):
+            continue
+        key = name[len('cover_'):-len('.json')]
+        jpg_name, meta_name = _render_cache_names(key)
+        try:
+            entry = json.loads(poster_storage.read(meta_name))
+        except (OSError, KeyError, ValueError):
+            continue
+        st = poster_storage.stat(jpg_name)
+        if st is None:
+            continue
+        entry['bytes'] = st[0]
+        entries.append((st[1], key, entry))
+    entries.sort(key=lambda e: e[0])
+    _render_cache = OrderedDict((key, entry) for _, key, entry in entries)
+    _render_cache_bytes = sum(entry['bytes'] for entry in _render_cache.values())
+
+def _drop_render_cache_entry(key):
+    # Caller holds _render_cache_lock
+    global _render_cache_bytes
+    entry = _render_cache.pop(key, None)
+    if entry is not None:
+        _render_cache_bytes -= entry['bytes']
+    for name in _render_cache_names(key):
+        poster_storage.delete(name)
+
+def render_cache_discard(key):
+    """Delete a cached poster and its sidecar, keeping the cache index in step."""
+    with _render_cache_lock:
+        if _render_cache is None:
+            # Not loaded yet; the index is built from what is left in storage
+            for name in _render_cache_names(key):
+                poster_storage.delete(name)
+        else:
+            _drop_render_cache_entry(key)
+
+def render_cache_get(key):
+    """Return the cached entry for key (filename, width, height, track_boxes) or None."""
+    if RENDER_CACHE_MAX_BYTES <= 0:
+        return None
+    with _render_cache_lock:
+        if _render_cache is None:
+            _load_render_cache()
+        entry = _render_cache.get(key)
+        if entry is None:
+            inc_metric('cache_misses_total', cache='render')
+            return None
+        jpg_name, _ = _render_cache_names(key)
+        # Record the access in storage too, so LRU order survives restarts
+        if not poster_storage.touch(jpg_name):
+            _drop_render_cache_entry(key)
+            inc_metric('cache_misses_total', cache='render')
+            return None
+        _render_cache.move_to_end(key)
+        inc_metric('cache_hits_total', cache='render')
+        return copy.deepcopy(entry)
+
+def render_cache_put(key, filename, width, height, track_boxes):
+    if RENDER_CACHE_MAX_BYTES <= 0:
+        return
+    global _render_cache_bytes
+    jpg_name, meta_name = _render_cache_names(key)
+    entry = {'filename': filename, 'width': width, 'height': height, 'track_boxes': list(track_boxes or [])}
+    poster_storage.save(meta_name, json.dumps(entry).encode('utf-8'))
+    st = poster_storage.stat(jpg_name)
+    if st is None:
+        return
+    entry['bytes'] = st[0]
+    with _render_cache_lock:
+        if _render_cache is None:
+            _load_render_cache()
+        if key in _render_cache:
+            _render_cache_bytes -= _render_cache.pop(key)['bytes']
+        _render_cache[key] = entry
+        _render_cache_bytes += entry['bytes']
+        # Evict least recently used posters, never the one just stored
+        while _render_cache_bytes > RENDER_CACHE_MAX_BYTES and len(_render_cache) > 1:
+            oldest = next(iter(_render_cache))
+            _drop_render_cache_entry(oldest)
+
+# --- Seeded text generation -------------------------------------------------
+# Artist names, album titles and track lists are drawn from a random.Random
+# seeded by the quiz answers (or a client-supplied seed), so the same inputs
+# always produce the same album and the poster can be re-rendered or cached.
+def text_seed(pet_info):
+    """Stable seed derived from the quiz answers."""
+    answers = {k: v.strip() for k, v in pet_info.items() if isinstance(v, str) and v.strip()}
+    blob = json.dumps(answers, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()[:16]
+
+def _text_rng(pet_info, part, seed=None):
+    # Each generator gets its own stream so adding a draw in one does not shift the others
+    if seed is None:
+        seed = text_seed(pet_info)
+    return random.Random(f"{seed}:{part}")
+
+def generate_album_content(pet_info, rng=None):
     """Generates the album content based on the pet's info using a detailed mapping plan."""
+    if rng is None:
+        rng = _text_rng(pet_info, 'tracks')
 
     track_list = []
     easter_eggs = []
@@ -719,7 +2375,7 @@ def generate_album_content(pet_info):
         'Bossy': ("Command Performance", "Rules of the House (Remix)", "Schedule Keeper"),
         'Wise Sage': ("Ancient Sunbeam", "Oracle of the Couch", "Whisker Wisdom")
     }
-    opener_track = random.choice(vibe_map.get(vibe, ["Pet Anthem"]))
+    opener_track = rng.choice(vibe_map.get(vibe, ["Pet Anthem"]))
 
     # Energy
     energy_map = {
@@ -727,7 +2383,7 @@ def generate_album_content(pet_info):
         'Balanced': ("Afternoon Zoom", "Gentle Pounce", "Window Patrol"),
         'Zoomies Every Hour': ("Midnight Zoomies", "Carpet Sprint", "Turbo Paw")
     }
-    energy_track = random.choice(energy_map.get(energy, ["Energy Flow"]))
+    energy_track = rng.choice(energy_map.get(energy, ["Energy Flow"]))
 
     # Play/Hobby
     activity = pet_info.get('favorite_activity')
@@ -739,7 +2395,7 @@ def generate_album_content(pet_info):
         'Bird TV': ("Feather Channel", "Window Gazette"),
         'Box forts': ("Cardboard Citadel", "Corrugated Dreams")
     }
-    hobby_track = random.choice(activity_map.get(activity, ["Playtime"]))
+    hobby_track = rng.choice(activity_map.get(activity, ["Playtime"]))
 
     # Quirk/Signature Move
     move = pet_info.get('signature_move')
@@ -751,7 +2407,7 @@ def generate_album_content(pet_info):
         'Spooky stare': ("Midnight Stare", "Ghost Lamp"),
         'Bread loaf': ("Loaf Mode", "Yeasty Rest")
     }
-    quirk_track = random.choice(move_map.get(move, ["Signature Move"]))
+    quirk_track = rng.choice(move_map.get(move, ["Signature Move"]))
 
     # Communication/Favorite Sound
     sound = pet_info.get('favorite_sound')
@@ -761,7 +2417,7 @@ def generate_album_content(pet_info):
         'Snorts/bleps': ("Blep Etude", "Snort Groove"),
         'Dramatic sighs': ("Sigh Sonata", "Long Exhale")
     }
-    sound_track = random.choice(sound_map.get(sound, ["Pet Sounds"]))
+    sound_track = rng.choice(sound_map.get(sound, ["Pet Sounds"]))
 
     # Affection/Cuddle Ballad
     cuddle = pet_info.get('cuddle_factor')
@@ -770,7 +2426,7 @@ def generate_album_content(pet_info):
         'Sometimes': ("Occasional Warmth", "Half-Blanket Waltz"),
         'Velcro': ("Stuck Like Fur", "Velcro Ballad")
     }
-    affection_track = random.choice(cuddle_map.get(cuddle, ["Cuddle Song"]))
+    affection_track = rng.choice(cuddle_map.get(cuddle, ["Cuddle Song"]))
 
     # Finale/Anthem
     sneakiness = pet_info.get('sneakiness')
@@ -779,14 +2435,14 @@ def generate_album_content(pet_info):
         'Occasional heist': ("Minor Caper", "Sneak Peek"),
         'Master thief': ("Grand Heist", "Midnight Mission")
     }
-    finale_track = random.choice(sneakiness_map.get(sneakiness, ["Finale"]))
+    finale_track = rng.choice(sneakiness_map.get(sneakiness, ["Finale"]))
 
     # --- Assembly Logic ---
     track_list.append(f"1. {opener_track}")
     track_list.append(f"2. {energy_track}")
     
     mid_tracks = [hobby_track, quirk_track, sound_track]
-    random.shuffle(mid_tracks)
+    rng.shuffle(mid_tracks)
     
     track_number = 3
     for track in mid_tracks:
@@ -798,14 +2454,14 @@ def generate_album_content(pet_info):
     if vibe == 'Goofball':
         habit = pet_info.get('weirdest_habit')
         if habit == 'Vocal monologues':
-             track_list.insert(random.randint(2, 4), f"{track_number}. Soliloquy at Dusk (Skit)")
+             track_list.insert(rng.randint(2, 4), f"{track_number}. Soliloquy at Dusk (Skit)")
         else:
-             track_list.insert(random.randint(2, 4), f"{track_number}. Goofball Interlude (Remix)")
+             track_list.insert(rng.randint(2, 4), f"{track_number}. Goofball Interlude (Remix)")
         has_interlude = True
         track_number += 1
 
     if pet_info.get('vocalness_description') == 'Opera' and not has_interlude:
-        track_list.insert(random.randint(2, 4), f"{track_number}. Vocal Solo (Interlude)")
+        track_list.insert(rng.randint(2, 4), f"{track_number}. Vocal Solo (Interlude)")
         has_interlude = True
         track_number += 1
 
@@ -817,7 +2473,7 @@ def generate_album_content(pet_info):
     while len(track_list) < track_count:
         track_list.insert(-2, f"{len(track_list)}. Bonus Track")
     while len(track_list) > track_count:
-        track_list.pop(random.randint(2, len(track_list) - 3))
+        track_list.pop(rng.randint(2, len(track_list) - 3))
 
     # Renumber tracks after all adjustments
     final_numbered_tracks = []
@@ -831,10 +2487,163 @@ def generate_album_content(pet_info):
 
     return {"track_list": final_numbered_tracks, "easter_eggs": easter_eggs}
 
+# --- Audio manifest ---------------------------------------------------------
+# Preview audio is resolved from an in-memory manifest of static/audio/ instead
+# of probing the filesystem per track: {audio_id: {'sources': [...], 'duration'}}
+# with formats in preference order, byte sizes, durations and static URLs
+# computed once. A background thread rescans the directory every
+# AUDIO_REFRESH_INTERVAL seconds (0 = never) and swaps in a new manifest only
+# when a file was added, removed or replaced.
+AUDIO_REFRESH_INTERVAL = float(os.environ.get('AUDIO_REFRESH_INTERVAL', '5'))
+
+# The curated 12-file pool; the file names (<id>.mp3 or .wav) are the contract
+AUDIO_POOL_IDS = (
+    'energy_fast', 'energy_chill', 'regal_grand', 'goofball_quirky', 'adventurer_outdoor',
+    'mischief_sneaky', 'vocal_opera', 'vocal_comic_blep', 'cozy_loaf', 'spooky_stare',
+    'playful_socks_pizz', 'neutral_default',
+)
+# Preferred first
+AUDIO_FORMATS = (('.mp3', 'audio/mpeg'), ('.wav', 'audio/wav'))
+
+_audio_manifest = None
+_audio_manifest_lock = threading.Lock()
+_audio_refresher = None
+
+# MPEG audio frame header tables: bitrates (kbit/s) by (version, layer), sample rates by version
+_MP3_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MP3_BITRATES[(2, 3)] = _MP3_BITRATES[(2, 2)]
+_MP3_SAMPLE_RATES = {1: (44100, 48000, 32000), 2: (22050, 24000, 16000), 2.5: (11025, 12000, 8000)}
+
+def _mp3_duration(path):
+    """Duration in seconds from the first frame (Xing/Info frame count, else CBR estimate)."""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        tag = f.read(10)
+        offset = 0
+        if tag[:3] == b'ID3' and len(tag) == 10:
+            # Syncsafe tag size, plus the 10 byte header
+            offset = 10 + ((tag[6] & 0x7f) << 21 | (tag[7] & 0x7f) << 14 | (tag[8] & 0x7f) << 7 | (tag[9] & 0x7f))
+        f.seek(offset)
+        head = f.read(64 * 1024)
+    for i in range(len(head) - 4):
+        if head[i] != 0xff or (head[i + 1] & 0xe0) != 0xe0:
+            continue
+        b1, b2, b3 = head[i + 1], head[i + 2], head[i + 3]
+        version = {3: 1, 2: 2, 0: 2.5}.get((b1 >> 3) & 3)
+        layer = {3: 1, 2: 2, 1: 3}.get((b1 >> 1) & 3)
+        bitrate_idx, rate_idx = b2 >> 4, (b2 >> 2) & 3
+        if version is None or layer is None or bitrate_idx in (0, 15) or rate_idx == 3:
+            continue
+        bitrate = _MP3_BITRATES[(min(version, 2), layer)][bitrate_idx] * 1000
+        sample_rate = _MP3_SAMPLE_RATES[version][rate_idx]
+        samples = 384 if layer == 1 else (1152 if layer == 2 or version == 1 else 576)
+        # Xing/Info header (VBR and LAME CBR files) sits after the side information
+        mono = (b3 >> 6) == 3
+        side = (17 if mono else 32) if version == 1 else (9 if mono else 17)
+        xing = head[i + 4 + side:i + 4 + side + 12]
+        if len(xing) == 12 and xing[:4] in (b'Xing', b'Info') and struct.unpack('>I', xing[4:8])[0] & 1:
+            frames = struct.unpack('>I', xing[8:12])[0]
+            return frames * samples / sample_rate
+        return (size - offset - i) * 8 / bitrate
+    return None
+
+def _audio_duration(path, ext):
+    try:
+        if ext == '.wav':
+            with wave.open(path, 'rb') as w:
+                return w.getnframes() / float(w.getframerate())
+        return _mp3_duration(path)
+    except (OSError, EOFError, wave.Error, struct.error):
+        return None
+
+def _scan_audio_dir():
+    # {file name: (size, mtime_ns)} of the audio files, one scandir
+    files = {}
+    try:
+        with os.scandir(AUDIO_DIR) as it:
+            for entry in it:
+                if entry.is_file() and os.path.splitext(entry.name)[1].lower() in dict(AUDIO_FORMATS):
+                    st = entry.stat()
+                    files[entry.name] = (st.st_size, st.st_mtime_ns)
+    except OSError:
+        pass
+    return files
+
+def _build_audio_manifest(files):
+    by_id = {}
+    for ext, mime in AUDIO_FORMATS:
+        for name, (size, mtime_ns) in sorted(files.items()):
+            stem, file_ext = os.path.splitext(name)
+            if file_ext.lower() != ext:
+                continue
+            by_id.setdefault(stem, {'sources': [], 'duration': None})
+            entry = by_id[stem]
+            duration = _audio_duration(os.path.join(AUDIO_DIR, name), ext)
+            entry['sources'].append({
+                'file': name,
+                # Versioned so browsers pick up a swapped file
+                'path': f"{app.static_url_path}/audio/{quote(name)}?v={mtime_ns // 1_000_000_000}",
+                'mime': mime,
+                'ext': ext,
+                'bytes': size,
+                'duration': duration,
+            })
+            if entry['duration'] is None:
+                entry['duration'] = duration
+    return {'files': files, 'ids': by_id, 'built': time.time()}
+
+def refresh_audio_manifest(force=False):
+    """Rescan static/audio/ and rebuild the manifest if anything changed; returns the manifest."""
+    global _audio_manifest
+    files = _scan_audio_dir()
+    with _audio_manifest_lock:
+        if force or _audio_manifest is None or _audio_manifest['files'] != files:
+            _audio_manifest = _build_audio_manifest(files)
+        return _audio_manifest
+
+def _audio_refresh_loop(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            refresh_audio_manifest()
+        except Exception:
+            app.logger.exception("Audio manifest refresh failed")
+
+def get_audio_manifest():
+    """The current manifest, built on first use (no filesystem access afterwards)."""
+    global _audio_refresher
+    manifest = _audio_manifest
+    if manifest is not None:
+        return manifest
+    manifest = refresh_audio_manifest()
+    with _audio_manifest_lock:
+        if _audio_refresher is None and AUDIO_REFRESH_INTERVAL > 0:
+            _audio_refresher = threading.Thread(target=_audio_refresh_loop, args=(AUDIO_REFRESH_INTERVAL,),
+                                                name='audio-manifest', daemon=True)
+            _audio_refresher.start()
+    return manifest
+
+def audio_sources(audio_id):
+    """[{'url', 'mime', 'ext', 'bytes', 'duration'}] for audio_id, preferred format first."""
+    entry = get_audio_manifest()['ids'].get(audio_id)
+    if entry is None:
+        return []
+    # Static URLs are precomputed; only an app mounted below / needs its prefix added
+    root = request.script_root if has_request_context() else ''
+    return [{'url': root + src['path'], 'mime': src['mime'], 'ext': src['ext'],
+             'bytes': src['bytes'], 'duration': src['duration']} for src in entry['sources']]
+
 def select_audio_track(pet_info):
     """Select a single 30s preview track based on priority mapping.
     Priority: Quirk > Mischief > Vocalness > Energy/Vibe > Default.
-    Returns dict: {file, trait, reason}
+    Returns dict: {file, trait, reason}; file is a pool id plus '.mp3'
+    (audio_sources() finds the formats actually present).
     """
     # Normalize inputs
     sig = (pet_info.get('signature_move') or '').strip()
@@ -847,9 +2656,9 @@ def select_audio_track(pet_info):
 
     # Quirks (signature move + weirdest habit)
     quirk_map = {
-        'Bread loaf': ('quirk_breadloaf.mp3', 'Quirk', 'Bread loaf'),
-        'Spooky stare': ('quirk_spooky.mp3', 'Quirk', 'Spooky stare'),
-        'Stealing socks': ('quirk_socks.mp3', 'Quirk', 'Stealing socks'),
+        'Bread loaf': ('cozy_loaf.mp3', 'Quirk', 'Bread loaf'),
+        'Spooky stare': ('spooky_stare.mp3', 'Quirk', 'Spooky stare'),
+        'Stealing socks': ('playful_socks_pizz.mp3', 'Quirk', 'Stealing socks'),
     }
     for key in (sig, habit):
         if key in quirk_map:
@@ -858,30 +2667,30 @@ def select_audio_track(pet_info):
 
     # Mischief / Bravery
     if sneak == 'Master thief':
-        return {"file": 'mischief_heist.mp3', "trait": 'Mischief', "reason": 'Master thief'}
+        return {"file": 'mischief_sneaky.mp3', "trait": 'Mischief', "reason": 'Master thief'}
 
     # Vocalness
     if vocal == 'Opera':
         return {"file": 'vocal_opera.mp3', "trait": 'Vocalness', "reason": 'Opera'}
     if fav_sound == 'Snorts/bleps':
-        return {"file": 'vocal_blep.mp3', "trait": 'Vocalness', "reason": 'Snorts/bleps'}
+        return {"file": 'vocal_comic_blep.mp3', "trait": 'Vocalness', "reason": 'Snorts/bleps'}
 
     # Energy
     if energy == 'Zoomies Every Hour':
-        return {"file": 'energy_zoomies.mp3', "trait": 'Energy', "reason": 'Zoomies Every Hour'}
+        return {"file": 'energy_fast.mp3', "trait": 'Energy', "reason": 'Zoomies Every Hour'}
     if energy == 'Chill':
         return {"file": 'energy_chill.mp3', "trait": 'Energy', "reason": 'Chill'}
 
     # Vibe
     if vibe == 'Regal':
-        return {"file": 'vibe_regal.mp3', "trait": 'Vibe', "reason": 'Regal'}
+        return {"file": 'regal_grand.mp3', "trait": 'Vibe', "reason": 'Regal'}
     if vibe == 'Goofball':
-        return {"file": 'vibe_goofball.mp3', "trait": 'Vibe', "reason": 'Goofball'}
+        return {"file": 'goofball_quirky.mp3', "trait": 'Vibe', "reason": 'Goofball'}
     if vibe == 'Adventurer':
-        return {"file": 'vibe_adventurer.mp3', "trait": 'Vibe', "reason": 'Adventurer'}
+        return {"file": 'adventurer_outdoor.mp3', "trait": 'Vibe', "reason": 'Adventurer'}
 
     # Default
-    return {"file": 'default.mp3', "trait": 'Default', "reason": 'Neutral'}
+    return {"file": 'neutral_default.mp3', "trait": 'Default', "reason": 'Neutral'}
 
 def map_track_to_stem(title: str) -> str:
     """Return ordered list of candidate audio IDs (subset of 12 pool) for a title.
@@ -931,11 +2740,7 @@ def map_track_to_stem(title: str) -> str:
 def build_track_previews(track_list):
     """Assign unique audio IDs (from 12-file pool) per poster, prioritizing uniqueness.
     Returns list of {title,audio_id,sources,exists}."""
-    pool_ids = [
-        'energy_fast','energy_chill','regal_grand','goofball_quirky','adventurer_outdoor',
-        'mischief_sneaky','vocal_opera','vocal_comic_blep','cozy_loaf','spooky_stare',
-        'playful_socks_pizz','neutral_default'
-    ]
+    pool_ids = AUDIO_POOL_IDS
     used = set()
     previews = []
     for track in (track_list or []):
@@ -960,26 +2765,23 @@ def build_track_previews(track_list):
         if not chosen:
             chosen = 'neutral_default'
         used.add(chosen)
-        # resolve file (.mp3 preferred then .wav)
-        sources = []
-        for e in ['.mp3', '.wav']:
-            fname = f"{chosen}{e}"
-            path = os.path.join(AUDIO_DIR, fname)
-            if os.path.exists(path):
-                sources.append({
-                    'url': url_for('static', filename=f'audio/{fname}'),
-                    'mime': 'audio/mpeg' if e == '.mp3' else 'audio/wav'
-                })
+        # resolve file (.mp3 preferred then .wav) from the manifest
+        sources = [{'url': src['url'], 'mime': src['mime']} for src in audio_sources(chosen)]
+        if not sources:
+            inc_metric('missing_audio_total', audio_id=chosen)
         previews.append({
             'title': title,
             'audio_id': chosen,
             'sources': sources,
-            'exists': len(sources) > 0
+            'exists': len(sources) > 0,
+            'duration': get_audio_manifest()['ids'].get(chosen, {}).get('duration'),
         })
     return previews
 
-def generate_artist_name(pet_info):
+def generate_artist_name(pet_info, rng=None):
     """Generates a creative artist name based on the pet's personality."""
+    if rng is None:
+        rng = _text_rng(pet_info, 'artist')
     name = pet_info.get('artist_name', 'The Artist')
     
     vibe_map = {
@@ -1019,7 +2821,7 @@ def generate_artist_name(pet_info):
     
     # Template 1: [Honorific] [Name]
     if vibe in vibe_map:
-        honorific = random.choice(vibe_map[vibe])
+        honorific = rng.choice(vibe_map[vibe])
         possible_names.append(f"{honorific} {name}")
 
     # Template 2: [Name] the [Epithet]
@@ -1049,7 +2851,7 @@ def generate_artist_name(pet_info):
     if not possible_names:
         chosen = name  # Default to just the name if no rules match
     else:
-        chosen = random.choice(possible_names)
+        chosen = rng.choice(possible_names)
 
     # Limit artist name to max 3 words to prevent vertical clipping.
     def _limit_words(text, max_words=3):
@@ -1081,8 +2883,10 @@ def generate_artist_name(pet_info):
     limited = _limit_words(chosen, 3)
     return limited
 
-def generate_album_title(pet_info):
+def generate_album_title(pet_info, rng=None):
     """Generates a creative album title based on the pet's personality."""
+    if rng is None:
+        rng = _text_rng(pet_info, 'title')
     
     energy_map = {
         'Chill': ["Loaf Mode", "Moonlit Ballads", "Slow Tails"],
@@ -1111,7 +2915,7 @@ def generate_album_title(pet_info):
 
     # Template 1: [Vibe Adjective] [Energy Word]
     if vibe in vibe_map and energy in energy_map:
-        possible_titles.append(f"{vibe_map[vibe]} {random.choice(energy_map[energy])}")
+        possible_titles.append(f"{vibe_map[vibe]} {rng.choice(energy_map[energy])}")
 
     # Template 2: [Story from Quirk]
     if quirk in quirk_map:
@@ -1123,37 +2927,63 @@ def generate_album_title(pet_info):
         
     # Fallback
     if energy in energy_map:
-        possible_titles.append(random.choice(energy_map[energy]))
+        possible_titles.append(rng.choice(energy_map[energy]))
 
     if not possible_titles:
         return "Greatest Hits"
 
-    return random.choice(possible_titles)
+    return rng.choice(possible_titles)
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/generate', methods=['POST'])
-def generate():
-    pet_info = request.form.to_dict()
+def _store_upload(filename, fileobj):
+    safe_name = secure_filename(os.path.basename(filename))
+    name = upload_storage.save(f"{int(time.time())}_{random.randint(100,999)}_{safe_name}", fileobj)
+    st = upload_storage.stat(name)
+    if st is not None:
+        observe_metric('upload_bytes', st[0])
+    return name
+
+def _first_upload(files):
+    """The first uploaded photo with an allowed extension (or None)."""
+    for file in files:
+        if not file or file.filename == '':
+            continue
+        if os.path.splitext(file.filename)[1].lower() in ALLOWED_EXTENSIONS:
+            return file
+    return None
+
+def _save_upload(files):
+    """Store the first acceptable uploaded photo; returns its upload_storage name (or None)."""
+    file = _first_upload(files)
+    if file is None:
+        return None
+    with span('upload_save'):
+        return _store_upload(file.filename, file.stream)
+
+def _read_upload(files):
+    """The first acceptable uploaded photo as an in-memory file, without storing it (or None)."""
+    file = _first_upload(files)
+    if file is None:
+        return None
+    with span('upload_read'):
+        return io.BytesIO(file.stream.read())
+
+def _upload_source(name):
+    # What the renderer reads: a path on disk backends, an in-memory file otherwise
+    return upload_storage.source(name) if name else None
+
+def build_album(form):
+    """Turn the quiz answers into pet_info (with artist/title) and album content."""
+    pet_info = dict(form)
+    # Optional client seed; otherwise texts are derived from the answers themselves
+    seed = pet_info.pop('seed', '').strip() or text_seed(pet_info)
     # Force poster mode and single style
     pet_info['poster_mode'] = 'on'
     pet_info['poster_style'] = 'melodrama'
-    # Handle uploaded photos
-    uploaded_files = request.files.getlist('photos') if 'photos' in request.files else []
-    saved_path = None
-    for file in uploaded_files:
-        if not file or file.filename == '':
-            continue
-        ext = os.path.splitext(file.filename)[1].lower()
-        if ext not in ALLOWED_EXTENSIONS:
-            continue
-        safe_name = secure_filename(file.filename)
-        saved_path = os.path.join(UPLOAD_DIR, f"{int(time.time())}_{random.randint(100,999)}_{safe_name}")
-        file.save(saved_path)
-        break
-    
+
     # Set mischief and vocalness scores based on descriptions
     if pet_info.get('sneakiness') == 'Master thief': pet_info['mischief'] = 5
     elif pet_info.get('sneakiness') == 'Occasional heist': pet_info['mischief'] = 3
@@ -1164,35 +2994,143 @@ def generate():
     else: pet_info['vocalness'] = 1
 
     # Generate creative names and titles
-    pet_info['artist_name'] = generate_artist_name(pet_info)
-    pet_info['album_title'] = generate_album_title(pet_info)
+    pet_info['artist_name'] = generate_artist_name(pet_info, _text_rng(pet_info, 'artist', seed))
+    pet_info['album_title'] = generate_album_title(pet_info, _text_rng(pet_info, 'title', seed))
 
-    content = generate_album_content(pet_info)
+    content = generate_album_content(pet_info, _text_rng(pet_info, 'tracks', seed))
+    return pet_info, content
 
-    # Generate cover image (uses first uploaded or fallback)
+# --- Render executor --------------------------------------------------------
+# RENDER_EXECUTOR=process runs generate_cover_image in a pool of worker
+# processes so renders are not serialized by the GIL. Workers are spawned (not
+# forked, the web process may already run threads), warm their fonts and masks
+# once, and exchange only small picklable values: pet_info strings, the photo
+# path and track titles in; filename, size and track boxes out.
+RENDER_EXECUTOR = os.environ.get('RENDER_EXECUTOR', 'inline').strip().lower()
+RENDER_PROCESSES = int(os.environ.get('RENDER_PROCESSES', '0')) or (os.cpu_count() or 1)
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+def _init_render_worker(poster_sizes):
+    # Runs once in each worker process
+    warm_up(poster_sizes)
+
+def _render_cover_task(pet_info, photo_path, tracks, filename):
     track_boxes = []
-    cover_filename, poster_w, poster_h = generate_cover_image(pet_info, saved_path, tracks=content.get('track_list'), track_boxes=track_boxes)
-    cover_url = url_for('static', filename=f'generated/{cover_filename}')
+    filename, width, height = generate_cover_image(pet_info, photo_path, tracks=tracks, track_boxes=track_boxes, filename=filename)
+    return filename, width, height, track_boxes
+
+def _render_cover_bytes_task(pet_info, photo_path, tracks, size):
+    buf, width, height = generate_cover_image(pet_info, photo_path, tracks=tracks, size=size, as_bytes=True)
+    return buf.getvalue(), width, height
+
+def get_render_pool():
+    """Return the shared process pool, starting all workers on first use."""
+    global _render_pool
+    if _render_pool is not None:
+        return _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            # Imported here: the web process only needs it with RENDER_EXECUTOR=process
+            from concurrent.futures import ProcessPoolExecutor
+            pool = ProcessPoolExecutor(
+                max_workers=RENDER_PROCESSES,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_render_worker,
+                initargs=((1024,),),
+            )
+            # Spin every worker up now rather than on the first requests
+            for f in [pool.submit(int) for _ in range(RENDER_PROCESSES)]:
+                f.result()
+            _render_pool = pool
+    return _render_pool
+
+def _reset_render_pool(pool):
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is pool:
+            _render_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _timed_task(task, *args):
+    # Runs in a worker process: collect its spans and ship them back with the result
+    start_timing()
+    try:
+        result = task(*args)
+    finally:
+        spans = stop_timing()
+    return result, spans
+
+def _run_render_task(task, *args):
+    if RENDER_EXECUTOR != 'process':
+        return task(*args)
+    from concurrent.futures.process import BrokenProcessPool
+    pool = get_render_pool()
+    try:
+        if current_timing() is None:
+            return pool.submit(task, *args).result()
+        # 'render_pool' is the wall time seen by the caller, queueing and pickling included
+        with span('render_pool'):
+            result, spans = pool.submit(_timed_task, task, *args).result()
+        merge_timing(spans)
+        return result
+    except BrokenProcessPool:
+        # A worker died (e.g. killed by the OOM killer); start a fresh pool next time
+        _reset_render_pool(pool)
+        raise
+
+def render_cover(pet_info, photo_path, tracks, filename):
+    """Render one poster with the configured executor; returns (filename, width, height, track_boxes)."""
+    if RENDER_EXECUTOR == 'process' and not poster_storage.shared:
+        # Workers cannot write into this process's storage; bring the JPEG back and store it here
+        data, width, height = _run_render_task(_render_cover_bytes_task, pet_info, photo_path, tracks, 1024)
+        poster_storage.save(filename, data)
+        return filename, width, height, layout_cover(pet_info, tracks)['track_boxes']
+    return _run_render_task(_render_cover_task, pet_info, photo_path, tracks, filename)
+
+def render_cover_bytes(pet_info, photo_path, tracks, size=1024):
+    """Render one poster in memory with the configured executor; returns (BytesIO, width, height)."""
+    data, width, height = _run_render_task(_render_cover_bytes_task, pet_info, photo_path, tracks, size)
+    return io.BytesIO(data), width, height
+
+def render_album(pet_info, content, photo_path=None):
+    """Render (or fetch from the render cache) the poster for an album.
+
+    Returns plain data (filename, size, track boxes) so it can run outside a
+    request context; URLs are built by the caller.
+    """
+    # Identical inputs reuse the cached poster
+    with span('render_cache'):
+        photo_hash = _file_sha256(photo_path) if photo_path else None
+        cache_key = render_cache_key(pet_info, content.get('track_list'), photo_hash)
+        cached = render_cache_get(cache_key)
+    if cached:
+        return {
+            'cover_filename': cached['filename'],
+            'poster_w': cached['width'],
+            'poster_h': cached['height'],
+            'track_boxes': cached['track_boxes'],
+        }
+    cover_filename, poster_w, poster_h, track_boxes = render_cover(
+        pet_info, photo_path, content.get('track_list'), f"cover_{cache_key}.jpg")
+    render_cache_put(cache_key, cover_filename, poster_w, poster_h, track_boxes)
+    return {'cover_filename': cover_filename, 'poster_w': poster_w, 'poster_h': poster_h, 'track_boxes': track_boxes}
+
+def _render_result_page(pet_info, content, result, timings=None):
+    cover_url = poster_storage.url(result['cover_filename'])
 
     # Single Audio selection (30s preview mapping for poster summary)
     audio_sel = select_audio_track(pet_info)
     # Support .mp3 or .wav; prefer mp3 if present
-    chosen_file = audio_sel.get('file') or ''
-    stem, ext = os.path.splitext(chosen_file)
-    candidates = []
-    for e in ['.mp3', '.wav']:
-        cand_path = os.path.join(AUDIO_DIR, stem + e)
-        if os.path.exists(cand_path):
-            candidates.append({
-                'url': url_for('static', filename=f'audio/{stem + e}'),
-                'mime': 'audio/mpeg' if e == '.mp3' else 'audio/wav',
-                'ext': e,
-            })
+    stem = os.path.splitext(audio_sel.get('file') or '')[0]
+    candidates = audio_sources(stem)
     audio_exists = len(candidates) > 0
     audio_url = candidates[0]['url'] if candidates else None
 
     # Per-track previews
-    track_previews = build_track_previews(content.get('track_list'))
+    with span('track_previews'):
+        track_previews = build_track_previews(content.get('track_list'))
 
     return render_template(
         'result.html',
@@ -1204,10 +3142,562 @@ def generate():
         audio_meta=audio_sel,
         audio_exists=audio_exists,
         track_previews=track_previews,
-        track_boxes=track_boxes,
-        poster_w=poster_w,
-        poster_h=poster_h,
+        track_boxes=result['track_boxes'],
+        poster_w=result['poster_w'],
+        poster_h=result['poster_h'],
+        timings=timing_rows(timings if timings is not None else current_timing()) if TIMING_DEBUG else None,
+    )
+
+# --- Warm-up ----------------------------------------------------------------
+# The first render after a deploy would otherwise pay for Pillow's plugin
+# imports, FreeType parsing of the poster fonts, photo programs, vignette
+# masks, template compilation, the audio manifest, the numpy import and the
+# JPEG codecs. warm_up() does all of that once: at startup with WARMUP=1 (in a
+# background thread, so boot is not delayed), on GET/POST /warmup (e.g. from a
+# readiness probe) and in every render worker.
+WARMUP = os.environ.get('WARMUP', '0').strip().lower() in ('1', 'true', 'yes', 'on')
+WARMUP_SIZES = tuple(int(v) for v in os.environ.get('WARMUP_SIZES', '1024').split(',') if v.strip())
+
+_WARMUP_VIBES = VIBES + (None,)
+_WARMUP_ENERGIES = tuple(_ENERGY_STAGES) + (None,)
+_WARMUP_PET = {
+    'vibe': 'Goofball', 'energy': 'Balanced', 'favorite_activity': 'Fetch',
+    'album_title': 'Warm Up Tapes', 'artist_name': 'DJ Biscuit',
+}
+
+_warmup_lock = threading.Lock()
+_warmup_report = None
+
+def _warmup_photo():
+    # A small JPEG, large enough for the draft decode and reduce paths
+    w, h = 1600, 1200
+    r = Image.linear_gradient('L').resize((w, h))
+    g = Image.radial_gradient('L').resize((w, h))
+    buf = io.BytesIO()
+    Image.merge('RGB', (r, g, r.transpose(Image.Transpose.FLIP_LEFT_RIGHT))).save(buf, 'JPEG', quality=85)
+    return buf
+
+def warm_up(poster_sizes=None, render=True):
+    """Load and build everything a first render needs; returns {'steps': {step: ms}, 'total_ms', ...}.
+
+    Runs once per process; later calls return the first report.
+    """
+    global _warmup_report
+    if _warmup_report is not None:
+        return _warmup_report
+    with _warmup_lock:
+        if _warmup_report is not None:
+            return _warmup_report
+        poster_sizes = tuple(poster_sizes or WARMUP_SIZES)
+        # Warm-up renders are not request work: keep them out of the timing record
+        record = stop_timing()
+        steps = {}
+        started = time.perf_counter()
+
+        def step(name, fn):
+            t0 = time.perf_counter()
+            fn()
+            steps[name] = round((time.perf_counter() - t0) * 1000, 1)
+
+        def fonts():
+            _get_font_registry()
+            for candidates in (_TITLE_FONTS, _ARTIST_FONTS, _ARTIST_SAFE_FONTS, _TRACK_BODY_FONTS, _TRACK_NUM_FONTS, _STICKER_FONTS):
+                _load_font(candidates, 32)
+
+        def programs():
+            for vibe in _WARMUP_VIBES:
+                for energy in _WARMUP_ENERGIES:
+                    _photo_program(vibe, energy, 'melodrama')
+
+        def renders():
+            photo = _warmup_photo()
+            tracks = [f"{i}. Track Number {i}" for i in range(1, 9)]
+            for size in poster_sizes:
+                generate_cover_image(_WARMUP_PET, photo, tracks=tracks, size=size, as_bytes=True)
+
+        try:
+            # All image plugins (WebP, PNG, ...), not just the five Image.open() preloads
+            step('imports', lambda: (Image.init(), _numpy()))
+            step('fonts', fonts)
+            step('programs', programs)
+            step('masks', lambda: warm_vignette_cache(poster_sizes))
+            step('templates', lambda: [app.jinja_env.get_template(t) for t in ('index.html', 'result.html', 'job.html')])
+            if multiprocessing.parent_process() is None:
+                step('audio', get_audio_manifest)
+            if render:
+                step('render', renders)
+            if RENDER_EXECUTOR == 'process' and multiprocessing.parent_process() is None:
+                step('render_pool', get_render_pool)
+        finally:
+            if record is not None:
+                _timing.record = record
+        _warmup_report = {
+            'pid': os.getpid(),
+            'sizes': list(poster_sizes),
+            'steps': steps,
+            'total_ms': round((time.perf_counter() - started) * 1000, 1),
+        }
+        app.logger.info("Warm-up finished in %.0f ms: %s", _warmup_report['total_ms'], steps)
+        return _warmup_report
+
+def start_warmup():
+    threading.Thread(target=warm_up, name='warmup', daemon=True).start()
+
+# --- Render job queue -------------------------------------------------------
+# RENDER_MODE=queue makes /generate enqueue the render and return at once;
+# a small pool of worker threads drains the bounded queue so web threads stay
+# free for static and audio traffic. Finished jobs are kept for RENDER_JOB_TTL
+# seconds so their result page can still be opened.
+RENDER_MODE = os.environ.get('RENDER_MODE', 'sync').strip().lower()
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', '2'))
+RENDER_QUEUE_DEPTH = int(os.environ.get('RENDER_QUEUE_DEPTH', '32'))
+RENDER_JOB_TTL = int(os.environ.get('RENDER_JOB_TTL', '3600'))
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+_job_queue = None
+_job_workers = []
+
+def _render_worker():
+    while True:
+        job = _job_queue.get()
+        record = start_timing() if TIMING_ENABLED else None
+        try:
+            job['status'] = 'running'
+            job['started'] = time.time()
+            job['result'] = render_album(job['pet_info'], job['content'], job['photo_path'])
+            job['status'] = 'done'
+        except Exception as e:
+            app.logger.exception("Render job %s failed", job['id'])
+            job['error'] = str(e)
+            job['status'] = 'error'
+        finally:
+            job['finished'] = time.time()
+            inc_metric('render_jobs_total', status=job['status'])
+            stop_timing()
+            if record is not None:
+                # Kept with the job so its result page can show the render's own spans
+                record['render_job'] = [job['finished'] - job['started'], 1]
+                job['timings'] = record
+                observe_timing(record)
+            _job_queue.task_done()
+
+def _ensure_render_workers():
+    global _job_queue
+    if _job_workers:
+        return
+    with _jobs_lock:
+        if _job_workers:
+            return
+        _job_queue = queue.Queue(maxsize=RENDER_QUEUE_DEPTH)
+        for n in range(max(1, RENDER_WORKERS)):
+            t = threading.Thread(target=_render_worker, name=f'render-worker-{n}', daemon=True)
+            t.start()
+            _job_workers.append(t)
+
+def _prune_jobs(now):
+    # Caller holds _jobs_lock
+    expired = [jid for jid, job in _jobs.items()
+               if job.get('finished') and now - job['finished'] > RENDER_JOB_TTL]
+    for jid in expired:
+        del _jobs[jid]
+
+def submit_render_job(pet_info, content, photo_path=None):
+    """Queue a poster render and return the job id; raises queue.Full when saturated."""
+    _ensure_render_workers()
+    now = time.time()
+    job = {
+        'id': uuid.uuid4().hex,
+        'status': 'queued',
+        'created': now,
+        'pet_info': pet_info,
+        'content': content,
+        'photo_path': photo_path,
+    }
+    with _jobs_lock:
+        _prune_jobs(now)
+        _job_queue.put_nowait(job)
+        _jobs[job['id']] = job
+    return job['id']
+
+def get_render_job(job_id):
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+def _wants_json():
+    best = request.accept_mimetypes.best_match(['application/json', 'text/html'])
+    return request.args.get('format') == 'json' or best == 'application/json'
+
+def _job_status(job):
+    status = {'id': job['id'], 'status': job['status']}
+    if job['status'] == 'queued' and _job_queue is not None:
+        status['queue_depth'] = _job_queue.qsize()
+    if job['status'] == 'done':
+        status['result_url'] = url_for('job_result', job_id=job['id'])
+        status['cover_url'] = poster_storage.url(job['result']['cover_filename'])
+    if job['status'] == 'error':
+        status['error'] = job.get('error')
+    return status
+
+@app.route('/generate', methods=['POST'])
+@profiled('generate')
+def generate():
+    # Handle uploaded photos
+    uploaded_files = request.files.getlist('photos') if 'photos' in request.files else []
+    upload_name = _save_upload(uploaded_files)
+    photo = _upload_source(upload_name)
+
+    pet_info, content = build_album(request.form.to_dict())
+
+    if RENDER_MODE == 'queue':
+        try:
+            job_id = submit_render_job(pet_info, content, photo)
+        except queue.Full:
+            inc_metric('render_queue_rejected_total')
+            if upload_name:
+                upload_storage.delete(upload_name)
+            return jsonify({'error': 'Render queue is full, try again shortly.'}), 503, {'Retry-After': '5'}
+        if _wants_json():
+            return jsonify({'id': job_id, 'status_url': url_for('job_status', job_id=job_id)}), 202
+        return redirect(url_for('job_status', job_id=job_id), code=303)
+
+    # Generate cover image (uses first uploaded or fallback)
+    result = render_album(pet_info, content, photo)
+    return _render_result_page(pet_info, content, result)
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = get_render_job(job_id)
+    if job is None:
+        abort(404)
+    if _wants_json():
+        return jsonify(_job_status(job))
+    if job['status'] == 'done':
+        return redirect(url_for('job_result', job_id=job_id))
+    return render_template('job.html', job=job), (500 if job['status'] == 'error' else 200)
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    job = get_render_job(job_id)
+    if job is None:
+        abort(404)
+    if job['status'] != 'done':
+        return redirect(url_for('job_status', job_id=job_id))
+    return _render_result_page(job['pet_info'], job['content'], job['result'], job.get('timings'))
+
+@app.route('/media/<bucket>/<path:name>')
+def media(bucket, name):
+    """Serve files from in-memory storage buckets (STORAGE_BACKEND=memory)."""
+    storage = _memory_buckets.get(bucket)
+    st = storage.stat(name) if storage is not None else None
+    if st is None:
+        abort(404)
+    try:
+        body = storage.open(name)
+    except KeyError:
+        # Evicted between stat and open
+        abort(404)
+    mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    return send_file(body, mimetype=mimetype, conditional=True, etag=f"{name}-{st[0]}", last_modified=st[1])
+
+def _render_queue_gauges():
+    gauges = {}
+    if RENDER_MODE == 'queue':
+        with _jobs_lock:
+            running = sum(1 for job in _jobs.values() if job['status'] == 'running')
+        gauges[('render_queue_depth', ())] = _job_queue.qsize() if _job_queue is not None else 0
+        gauges[('render_queue_capacity', ())] = RENDER_QUEUE_DEPTH
+        gauges[('render_jobs_running', ())] = running
+    return gauges
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text exposition of the counters, histograms and queue gauges."""
+    if not METRICS_ENABLED:
+        abort(404)
+    counters, histograms = collect_metrics()
+    body = format_metrics(counters, histograms, _render_queue_gauges())
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+@app.route('/warmup', methods=['GET', 'POST'])
+def warmup():
+    """Run (or wait for) the warm-up; 200 with its report once the app is warm."""
+    return jsonify(warm_up())
+
+@app.route('/debug/timings')
+def debug_timings():
+    """Per-stage timing histograms (TIMING_DEBUG only)."""
+    if not TIMING_DEBUG:
+        abort(404)
+    return jsonify({'buckets': TIMING_BUCKETS, 'stages': timing_histograms()})
+
+# --- Batch API --------------------------------------------------------------
+# POST /api/batch takes a JSONL manifest (one object of quiz answers per line,
+# optionally with "id" and "photo") plus the photos as repeated "photos" files
+# and/or an "archive" zip. Only photos the manifest names are read, into
+# memory; batch inputs are never written to upload storage. Items render
+# concurrently through render_album, so they share the render cache and
+# executor, and results stream back as NDJSON in completion order, or as one
+# ZIP of posters plus results.jsonl.
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', '200'))
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', '0')) or RENDER_WORKERS
+BATCH_MAX_PHOTO_BYTES = 50 * 1024 * 1024
+
+def _batch_photo_names(entries):
+    """Basenames of the photos the parsed manifest refers to."""
+    return {os.path.basename(str(item['photo'])) for _, item, error in entries
+            if error is None and item.get('photo')}
+
+def _collect_batch_photos(files, archive, wanted):
+    """Read the wanted photos into memory; returns {basename: bytes}.
+
+    Uploads and archive members the manifest does not name are skipped unread.
+    Raises ValueError when more than BATCH_MAX_ITEMS photos are sent.
+    """
+    files = [f for f in files if f and f.filename and os.path.splitext(f.filename)[1].lower() in ALLOWED_EXTENSIONS]
+    if len(files) > BATCH_MAX_ITEMS:
+        raise ValueError(f"{len(files)} photos uploaded; the limit is {BATCH_MAX_ITEMS}")
+    photos = {}
+    for file in files:
+        name = os.path.basename(file.filename)
+        if name in wanted:
+            photos[name] = file.stream.read()
+    if archive and archive.filename:
+        with zipfile.ZipFile(archive.stream) as zf:
+            members = [m for m in zf.infolist() if not m.is_dir() and os.path.basename(m.filename)
+                       and os.path.splitext(m.filename)[1].lower() in ALLOWED_EXTENSIONS]
+            if len(members) > BATCH_MAX_ITEMS:
+                raise ValueError(f"archive has {len(members)} photos; the limit is {BATCH_MAX_ITEMS}")
+            for member in members:
+                name = os.path.basename(member.filename)
+                if name not in wanted:
+                    continue
+                if member.file_size > BATCH_MAX_PHOTO_BYTES:
+                    app.logger.warning("Skipping %s from batch archive: %d bytes", member.filename, member.file_size)
+                    continue
+                photos[name] = zf.read(member)
+    return photos
+
+def _parse_batch_manifest(stream):
+    """Yield (index, item, error) for each non-blank manifest line."""
+    for index, raw in enumerate(io.TextIOWrapper(stream, encoding='utf-8')):
+        line = raw.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            yield index, None, f"invalid JSON: {e}"
+            continue
+        if not isinstance(item, dict):
+            yield index, None, "manifest lines must be JSON objects"
+            continue
+        yield index, item, None
+
+def _render_batch_item(item, photos):
+    photo = item.get('photo')
+    photo_path = None
+    if photo:
+        data = photos.get(os.path.basename(str(photo)))
+        if data is None:
+            raise ValueError(f"photo not found in upload: {photo}")
+        # Each item gets its own file object (they are not shared between threads)
+        photo_path = io.BytesIO(data)
+    answers = {k: str(v) for k, v in item.items() if k not in ('id', 'photo') and v is not None}
+    pet_info, content = build_album(answers)
+    result = render_album(pet_info, content, photo_path)
+    return pet_info, content, result
+
+class _ZipSink(io.RawIOBase):
+    """Write-only, unseekable file that buffers what ZipFile writes until drained.
+
+    ZipFile falls back to data descriptors on unseekable output, so an archive
+    can be sent member by member as it is written.
+    """
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _batch_record(index, item, outcome=None, error=None):
+    record = {'index': index, 'id': (item or {}).get('id', index)}
+    if error is not None:
+        record.update(status='error', error=error)
+        return record
+    pet_info, content, result = outcome
+    record.update(
+        status='ok',
+        cover_url=poster_storage.url(result['cover_filename'], external=True),
+        width=result['poster_w'],
+        height=result['poster_h'],
+        artist_name=pet_info['artist_name'],
+        album_title=pet_info['album_title'],
+        track_list=content.get('track_list'),
     )
+    return record
+
+def _run_batch(entries, photos):
+    """Yield (index, item, outcome, error) as items finish."""
+    pool = ThreadPoolExecutor(max_workers=max(1, BATCH_WORKERS))
+    try:
+        futures = {}
+        for index, item, error in entries:
+            if error is not None:
+                yield index, item, None, error
+                continue
+            futures[pool.submit(_render_batch_item, item, photos)] = (index, item)
+        for future in as_completed(futures):
+            index, item = futures[future]
+            try:
+                yield index, item, future.result(), None
+            except Exception as e:
+                app.logger.warning("Batch item %s failed: %s", index, e)
+                yield index, item, None, str(e)
+    finally:
+        # Client went away mid-stream: drop the renders that have not started
+        pool.shutdown(wait=False, cancel_futures=True)
+
+@app.route('/api/batch', methods=['POST'])
+def api_batch():
+    manifest = request.files.get('manifest')
+    if manifest is None or manifest.filename == '':
+        return jsonify({'error': "missing 'manifest' file (JSONL)"}), 400
+    entries = list(_parse_batch_manifest(manifest.stream))
+    if len(entries) > BATCH_MAX_ITEMS:
+        return jsonify({'error': f"manifest has {len(entries)} items; the limit is {BATCH_MAX_ITEMS}"}), 413
+    try:
+        photos = _collect_batch_photos(request.files.getlist('photos'), request.files.get('archive'),
+                                       _batch_photo_names(entries))
+    except zipfile.BadZipFile:
+        return jsonify({'error': "'archive' is not a valid zip file"}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 413
+
+    fmt = (request.args.get('format') or request.form.get('format') or 'ndjson').lower()
+    if fmt == 'zip':
+        def stream_zip():
+            # Each poster is sent as soon as it is added; results.jsonl closes the archive
+            sink = _ZipSink()
+            records = []
+            with zipfile.ZipFile(sink, 'w') as zf:
+                for index, item, outcome, error in _run_batch(entries, photos):
+                    record = _batch_record(index, item, outcome, error)
+                    if outcome is not None:
+                        cover_filename = outcome[2]['cover_filename']
+                        label = secure_filename(str(item['id'])) if 'id' in item else ''
+                        record['file'] = f"{index:03d}_{label or 'cover'}.jpg"
+                        # Posters are already JPEG-compressed; store them as-is
+                        zf.writestr(record['file'], poster_storage.read(cover_filename), compress_type=zipfile.ZIP_STORED)
+                    records.append(record)
+                    chunk = sink.drain()
+                    if chunk:
+                        yield chunk
+                records.sort(key=lambda r: r['index'])
+                zf.writestr('results.jsonl', ''.join(json.dumps(r) + '\n' for r in records), compress_type=zipfile.ZIP_DEFLATED)
+            yield sink.drain()
+        return Response(stream_with_context(stream_zip()), mimetype='application/zip',
+                        headers={'Content-Disposition': 'attachment; filename=covers.zip'})
+
+    def stream():
+        for index, item, outcome, error in _run_batch(entries, photos):
+            yield json.dumps(_batch_record(index, item, outcome, error)) + '\n'
+    return Response(stream_with_context(stream()), mimetype='application/x-ndjson')
+
+# Direct image endpoint: GET with the quiz answers as query parameters (or POST
+# them with a photo) and the JPEG comes straight back, never touching
+# static/generated/ or static/uploads/. The ETag is the render cache key, so
+# revalidation answers 304 before any rendering happens.
+RENDER_MAX_AGE = int(os.environ.get('RENDER_MAX_AGE', '86400'))
+RENDER_SIZES = (256, 512, 1024, 2048)
+
+@app.route('/render.jpg', methods=['GET', 'POST'])
+def render_jpg():
+    params = request.values.to_dict()
+    try:
+        size = int(params.pop('size', 1024))
+    except ValueError:
+        size = 0
+    if size not in RENDER_SIZES:
+        return jsonify({'error': f"size must be one of {list(RENDER_SIZES)}"}), 400
+
+    uploaded_files = request.files.getlist('photos') if 'photos' in request.files else []
+    # The photo is hashed and decoded in memory, so previews leave nothing on disk
+    photo = _read_upload(uploaded_files)
+    pet_info, content = build_album(params)
+    photo_hash = _file_sha256(photo) if photo else None
+    etag = render_cache_key(pet_info, content.get('track_list'), photo_hash, size=size)
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        # A poster already in the render cache is served from disk instead of re-rendered
+        cached = render_cache_get(etag) if size == 1024 else None
+        if cached:
+            body = poster_storage.path(cached['filename']) or poster_storage.open(cached['filename'])
+        else:
+            body, _, _ = render_cover_bytes(pet_info, photo, content.get('track_list'), size=size)
+        response = send_file(body, mimetype='image/jpeg', conditional=True, etag=False, max_age=RENDER_MAX_AGE)
+    response.set_etag(etag)
+    # Same inputs always give the same poster, so caches never need to revalidate
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = RENDER_MAX_AGE
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/api/print', methods=['POST'])
+def api_print():
+    """Stream a print-resolution poster (format=png|pdf|jpg, paper=a4|a3|a2|letter, dpi)."""
+    fmt = (request.args.get('format') or request.form.get('format') or 'pdf').lower()
+    paper = (request.args.get('paper') or request.form.get('paper') or 'a3').lower()
+    if fmt not in PRINT_FORMATS or paper not in PRINT_PAPERS:
+        return jsonify({'error': f"format must be one of {sorted(PRINT_FORMATS)}, paper one of {sorted(PRINT_PAPERS)}"}), 400
+    try:
+        dpi = int(request.args.get('dpi') or request.form.get('dpi') or 300)
+    except ValueError:
+        return jsonify({'error': 'dpi must be an integer'}), 400
+    width = print_width(paper, dpi) if dpi > 0 else 0
+    if not 0 < width * int(width * 1.25) <= PRINT_MAX_PIXELS:
+        return jsonify({'error': f"{paper.upper()} at {dpi} dpi is outside the allowed print size"}), 413
+
+    uploaded_files = request.files.getlist('photos') if 'photos' in request.files else []
+    # Print jobs read the photo from memory, like /render.jpg, and store nothing
+    photo = _read_upload(uploaded_files)
+    form = {k: v for k, v in request.form.to_dict().items() if k not in ('format', 'paper', 'dpi')}
+    pet_info, content = build_album(form)
+    body = stream_print_poster(pet_info, photo, content.get('track_list'), fmt=fmt, paper=paper, dpi=dpi)
+    download_name = f"{secure_filename(pet_info['album_title']) or 'poster'}_{paper}.{fmt}"
+    return Response(stream_with_context(body), mimetype=PRINT_FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{download_name}"'})
+
+# Optional warm-up, e.g. VIGNETTE_WARMUP=1024,2048
+if os.environ.get('VIGNETTE_WARMUP'):
+    warm_vignette_cache(int(v) for v in os.environ['VIGNETTE_WARMUP'].split(',') if v.strip())
+
+# Background retention (JANITOR_INTERVAL=0 turns it off). It starts with the first
+# request a process serves, so scripts that import this module (cleanup_storage,
+# Pet_Album) and render workers never delete files on their own.
+@app.before_request
+def _start_background_janitor():
+    if _janitor_thread is None and JANITOR_INTERVAL > 0 and not app.testing:
+        start_janitor()
+
+# Warm-up at boot, e.g. WARMUP=1 WARMUP_SIZES=1024,2048 (render workers warm themselves)
+if WARMUP and multiprocessing.parent_process() is None:
+    start_warmup()
+
+# Per-process metrics snapshots for multi-process deployments, e.g. METRICS_DIR=/tmp/rockstar-metrics
+if METRICS_ENABLED and METRICS_DIR:
+    start_metrics_snapshots()
 
 if __name__ == '__main__':
     app.run(debug=True)
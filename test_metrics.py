@@ -0,0 +1,26 @@
+import app
+
+# No background janitor: it would prune the checked-in static files
+app.app.testing = True
+
+
+def _requests_total(endpoint):
+    counters, _ = app._local_metrics()
+    return sum(value for (name, labels), value in counters.items()
+               if name == 'http_requests_total' and dict(labels).get('endpoint') == endpoint)
+
+
+def test_streamed_request_counted_once():
+    client = app.app.test_client()
+    before = _requests_total('api_print')
+    response = client.post('/api/print', data={'artist_name': 'Rex', 'vibe': 'Regal',
+                                               'format': 'png', 'paper': 'a4', 'dpi': '20'})
+    assert response.status_code == 200
+    assert response.get_data()
+    response.close()
+    assert _requests_total('api_print') - before == 1
+
+
+if __name__ == '__main__':
+    test_streamed_request_counted_once()
+    print('ok')
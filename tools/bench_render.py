@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Benchmark the cover rendering pipeline and compare runs against a baseline.
+
+Benchmarks:
+- cover:    generate_cover_image over poster sizes, photo resolutions (none,
+            2 MP, 12 MP, 48 MP), track counts and title/artist lengths,
+            including a very long artist that falls back to stacked letters
+- content:  generate_album_content
+- previews: build_track_previews
+- generate: the full POST /generate route through the Flask test client
+
+By default each axis is varied on its own around a 1024 px / 2 MP / 8 track
+base case; --full runs the whole cartesian matrix. Photos are synthesized
+deterministically and all random generators are seeded, so runs on the same
+machine are comparable. Each case runs in a fresh process (unless
+--no-isolate) so its peak RSS is its own; allocation peaks come from one extra
+iteration under tracemalloc (Python objects only, Pillow's pixel buffers are
+not traced, the RSS covers those).
+
+The app runs with STORAGE_BACKEND=memory and the render cache off unless
+those are set explicitly, so nothing is written to static/.
+
+Windows PowerShell:
+    python .\\tools\\bench_render.py --out bench.json
+    python .\\tools\\bench_render.py --baseline bench.json --out bench-new.json
+    python .\\tools\\bench_render.py --compare bench.json bench-new.json --threshold 0.1
+"""
+import argparse
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows: no getrusage, peak RSS is reported as null
+    resource = None
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault('STORAGE_BACKEND', 'memory')
+os.environ.setdefault('RENDER_CACHE_MAX_BYTES', '0')
+
+SIZES = (512, 1024, 2048)
+PHOTOS = {'none': None, '2mp': (1732, 1155), '12mp': (4000, 3000), '48mp': (8000, 6000)}
+TRACK_COUNTS = (3, 8, 14)
+TEXTS = {
+    'short': ('Hi', 'Mo'),
+    'typical': ('The Heist Tapes', 'DJ Biscuit'),
+    'long': ('A Very Long Album Title That Goes On And On', 'Professor Maximilian Wigglesworth Thunderpaws III'),
+    # Too long to rotate legibly: the layout stacks the letters instead
+    'stacked': ('Greatest Hits', ('Sir Fluffington Barkmore ' * 8).strip()),
+}
+BASE = {'size': 1024, 'photo': '2mp', 'tracks': 8, 'text': 'typical'}
+
+PET = {
+    'vibe': 'Goofball',
+    'energy': 'Balanced',
+    'favorite_activity': 'Fetch',
+    'signature_move': 'Zoomies',
+    'favorite_sound': 'Barks/meows',
+    'cuddle_factor': 'Velcro',
+    'sneakiness': 'Occasional heist',
+    'weirdest_habit': 'Vocal monologues',
+    'vocalness_description': 'Chatty',
+    'social': 'Party animal',
+}
+
+# Minimum absolute change before a slower case counts as a regression
+MIN_DELTA_MS = 1.0
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def synth_photo(name, photo_dir):
+    """Deterministic JPEG of the given PHOTOS resolution, created once per run."""
+    if PHOTOS[name] is None:
+        return None
+    from PIL import Image
+    path = os.path.join(photo_dir, f'{name}.jpg')
+    if not os.path.exists(path):
+        w, h = PHOTOS[name]
+        r = Image.linear_gradient('L').resize((w, h))
+        g = Image.radial_gradient('L').resize((w, h))
+        b = r.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+        Image.merge('RGB', (r, g, b)).save(path, 'JPEG', quality=90)
+    return path
+
+
+def case_list(full=False, only=None):
+    cases = []
+    if full:
+        for size, photo, tracks, text in itertools.product(SIZES, PHOTOS, TRACK_COUNTS, TEXTS):
+            cases.append({'bench': 'cover', 'size': size, 'photo': photo, 'tracks': tracks, 'text': text})
+    else:
+        variants = [dict(BASE)]
+        variants += [dict(BASE, size=v) for v in SIZES if v != BASE['size']]
+        variants += [dict(BASE, photo=v) for v in PHOTOS if v != BASE['photo']]
+        variants += [dict(BASE, tracks=v) for v in TRACK_COUNTS if v != BASE['tracks']]
+        variants += [dict(BASE, text=v) for v in TEXTS if v != BASE['text']]
+        # The stacked fallback is most likely on small posters
+        variants.append(dict(BASE, size=512, text='stacked'))
+        cases += [dict(v, bench='cover') for v in variants]
+    cases.append({'bench': 'content', 'text': 'typical'})
+    cases.append({'bench': 'previews', 'tracks': 14})
+    cases.append({'bench': 'generate', 'photo': 'none'})
+    cases.append({'bench': 'generate', 'photo': '12mp'})
+    for case in cases:
+        case['name'] = case_name(case)
+    if only:
+        cases = [c for c in cases if only in c['name']]
+    return cases
+
+
+def case_name(case):
+    keys = ('size', 'photo', 'tracks', 'text')
+    return case['bench'] + ''.join(f"/{k}={case[k]}" for k in keys if k in case)
+
+
+def make_call(app, case, photo_dir):
+    """Return (fn, params) where fn() runs one iteration of the case."""
+    title, artist = TEXTS[case.get('text', 'typical')]
+    pet_info = dict(PET, album_title=title, artist_name=artist)
+    tracks = [f"{i}. Track Number {i} Song" for i in range(1, case.get('tracks', 8) + 1)]
+    photo = synth_photo(case.get('photo', 'none'), photo_dir)
+    params = {}
+
+    if case['bench'] == 'cover':
+        params['artist_mode'] = app.layout_cover(pet_info, tracks, size=case['size'])['artist']['mode']
+
+        def fn():
+            app.generate_cover_image(pet_info, photo, tracks=tracks, size=case['size'], as_bytes=True)
+    elif case['bench'] == 'content':
+        def fn():
+            app.generate_album_content(pet_info, random.Random(1))
+    elif case['bench'] == 'previews':
+        def fn():
+            with app.app.test_request_context():
+                app.build_track_previews(tracks)
+    elif case['bench'] == 'generate':
+        client = app.app.test_client()
+        photo_bytes = Path(photo).read_bytes() if photo else None
+
+        def fn():
+            data = dict(PET, seed='bench')
+            if photo_bytes:
+                data['photos'] = (io.BytesIO(photo_bytes), os.path.basename(photo))
+            resp = client.post('/generate', data=data, content_type='multipart/form-data')
+            if resp.status_code != 200:
+                raise RuntimeError(f"/generate returned {resp.status_code}")
+    else:
+        raise ValueError(f"unknown benchmark {case['bench']}")
+    return fn, params
+
+
+def run_case(case, iterations, warmup, photo_dir):
+    """Time one case in this process; returns its result record."""
+    import app
+    random.seed(1)
+    fn, params = make_call(app, case, photo_dir)
+
+    t0 = time.perf_counter()
+    fn()
+    first_ms = (time.perf_counter() - t0) * 1000
+    for _ in range(max(0, warmup - 1)):
+        fn()
+    times = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000)
+
+    tracemalloc.start()
+    fn()
+    _, alloc_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'name': case['name'],
+        'bench': case['bench'],
+        'params': {**{k: v for k, v in case.items() if k not in ('name', 'bench')}, **params},
+        'iterations': iterations,
+        'first_ms': round(first_ms, 2),
+        'p50_ms': round(percentile(times, 0.5), 2),
+        'p95_ms': round(percentile(times, 0.95), 2),
+        'mean_ms': round(sum(times) / len(times), 2),
+        'peak_rss_mb': peak_rss_mb(),
+        'alloc_peak_kb': round(alloc_peak / 1024, 1),
+    }
+
+
+def run_benchmarks(cases, iterations, warmup, isolate=True):
+    photo_dir = tempfile.mkdtemp(prefix='rockstar-bench-')
+    # Synthesize photos up front so their encoding is not part of any case. Done
+    # in a child process: peak RSS is inherited by processes started from here.
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        for name in {c.get('photo', 'none') for c in cases}:
+            pool.submit(synth_photo, name, photo_dir).result()
+    results = []
+    for i, case in enumerate(cases, 1):
+        if isolate:
+            # A fresh process per case: its peak RSS and caches are its own
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                result = pool.submit(run_case, case, iterations, warmup, photo_dir).result()
+        else:
+            result = run_case(case, iterations, warmup, photo_dir)
+        results.append(result)
+        print(f"[{i}/{len(cases)}] {result['name']}: p50 {result['p50_ms']:.1f} ms, "
+              f"p95 {result['p95_ms']:.1f} ms, rss {result['peak_rss_mb']} MB", file=sys.stderr)
+    return results
+
+
+def environment():
+    from PIL import Image
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    return {
+        'python': platform.python_version(),
+        'pillow': Image.__version__,
+        'numpy': numpy_version,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def compare(baseline, current, threshold=0.1):
+    """Per-case changes of current vs baseline; returns (rows, regressions)."""
+    base = {r['name']: r for r in baseline['results']}
+    rows, regressions = [], []
+    for r in current['results']:
+        b = base.get(r['name'])
+        if b is None:
+            continue
+        row = {'name': r['name']}
+        for metric in ('p50_ms', 'p95_ms', 'peak_rss_mb'):
+            old, new = b.get(metric), r.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            row[metric] = (old, new, change)
+            # Latency needs a minimum absolute change too, fast cases are noisy
+            if change > threshold and (metric == 'peak_rss_mb' or new - old >= MIN_DELTA_MS):
+                regressions.append((r['name'], metric, old, new, change))
+        rows.append(row)
+    return rows, regressions
+
+
+def print_comparison(rows, regressions, threshold, file=None):
+    file = file or sys.stdout
+    print(f"{'case':60} {'p50 ms':>22} {'p95 ms':>22} {'rss MB':>20}", file=file)
+    for row in rows:
+        cells = []
+        for metric in ('p50_ms', 'p95_ms', 'peak_rss_mb'):
+            if metric in row:
+                old, new, change = row[metric]
+                cells.append(f"{old:.1f} -> {new:.1f} {change:+.0%}".rjust(22 if metric != 'peak_rss_mb' else 20))
+            else:
+                cells.append('-'.rjust(22 if metric != 'peak_rss_mb' else 20))
+        print(f"{row['name']:60} {' '.join(cells)}", file=file)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {threshold:.0%}:", file=file)
+        for name, metric, old, new, change in regressions:
+            print(f"  {name} {metric}: {old} -> {new} ({change:+.0%})", file=file)
+    else:
+        print(f"\nNo regressions over {threshold:.0%}.", file=file)
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark poster rendering and compare against a baseline.")
+    parser.add_argument('--full', action='store_true', help="run the full size x photo x tracks x text matrix")
+    parser.add_argument('--only', help="only cases whose name contains this text, e.g. cover/size=2048")
+    parser.add_argument('--iterations', type=int, default=10, help="timed iterations per case (default: %(default)s)")
+    parser.add_argument('--warmup', type=int, default=2, help="untimed iterations per case, the first is reported as first_ms (default: %(default)s)")
+    parser.add_argument('--no-isolate', action='store_true', help="run every case in this process (faster, RSS is cumulative)")
+    parser.add_argument('--out', help="write results JSON here (default: stdout)")
+    parser.add_argument('--baseline', help="compare this run against a stored results JSON")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), help="compare two stored results files without running")
+    parser.add_argument('--threshold', type=float, default=0.1, help="relative slowdown that counts as a regression (default: %(default)s)")
+    args = parser.parse_args()
+
+    if args.compare:
+        baseline, current = load(args.compare[0]), load(args.compare[1])
+    else:
+        cases = case_list(args.full, args.only)
+        if not cases:
+            parser.error("no cases match --only")
+        current = {
+            'environment': environment(),
+            'results': run_benchmarks(cases, max(1, args.iterations), max(1, args.warmup), not args.no_isolate),
+        }
+        text = json.dumps(current, indent=2)
+        if args.out:
+            with open(args.out, 'w', encoding='utf-8') as f:
+                f.write(text + '\n')
+        else:
+            print(text)
+        if not args.baseline:
+            return 0
+        baseline = load(args.baseline)
+
+    rows, regressions = compare(baseline, current, args.threshold)
+    # With the results JSON on stdout, keep the comparison off it
+    print_comparison(rows, regressions, args.threshold, sys.stdout if args.compare or args.out else sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
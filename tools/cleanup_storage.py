@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Apply age and size retention to static/uploads/ and static/generated/.
+
+Uses the same Janitor as the app's background thread (JANITOR_INTERVAL), so the
+STORAGE_BACKEND and RETENTION_* environment variables apply. Command-line flags
+override them. Files are removed least recently accessed first until each
+bucket is under its size limit; anything older than the age limit goes too.
+
+Windows PowerShell:
+    python .\\tools\\cleanup_storage.py --dry-run
+    python .\\tools\\cleanup_storage.py --bucket generated --max-age-days 14 --max-bytes 500M
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app  # noqa: E402
+
+UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_bytes(text):
+    text = text.strip().upper().rstrip('B')
+    if text and text[-1] in UNITS:
+        return int(float(text[:-1]) * UNITS[text[-1]])
+    return int(text)
+
+
+def human(n):
+    for unit in ('B', 'KB', 'MB'):
+        if n < 1024:
+            return f"{n:.0f} {unit}" if unit == 'B' else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+
+def clean_bucket(bucket, args):
+    max_age, max_bytes = app.RETENTION[bucket]
+    if args.max_age_days is not None:
+        max_age = args.max_age_days * 86400
+    if args.max_bytes is not None:
+        max_bytes = args.max_bytes
+    storage = app.upload_storage if bucket == 'uploads' else app.poster_storage
+    janitor = app.Janitor(storage, max_age=max_age, max_bytes=max_bytes, batch=args.batch,
+                          min_age=args.min_age, dry_run=args.dry_run)
+    deleted = reclaimed = 0
+    # One full walk to build the index, then keep going until nothing more is evicted
+    while True:
+        report = janitor.run_once()
+        deleted += report['deleted']
+        reclaimed += report['bytes_reclaimed']
+        if report['sweeps'] >= 1 and not report['deleted']:
+            break
+    verb = 'Would remove' if args.dry_run else 'Removed'
+    print(f"{bucket}: {verb} {deleted} file(s), {human(reclaimed)} reclaimed; "
+          f"{report['tracked_files']} file(s), {human(report['tracked_bytes'])} kept")
+    return reclaimed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete old and least recently used uploads and posters.")
+    parser.add_argument('--bucket', choices=['uploads', 'generated', 'all'], default='all')
+    parser.add_argument('--max-age-days', type=float, default=None, help="delete files not accessed for this many days (0 = no limit)")
+    parser.add_argument('--max-bytes', type=parse_bytes, default=None, help="size limit per bucket, e.g. 500M or 2G (0 = no limit)")
+    parser.add_argument('--min-age', type=int, default=app.JANITOR_MIN_AGE, help="never evict files younger than this many seconds for size (default: %(default)s)")
+    parser.add_argument('--batch', type=int, default=app.JANITOR_BATCH, help="entries examined per pass (default: %(default)s)")
+    parser.add_argument('--dry-run', action='store_true', help="report what would be deleted without deleting")
+    args = parser.parse_args()
+
+    buckets = list(app.RETENTION) if args.bucket == 'all' else [args.bucket]
+    total = sum(clean_bucket(bucket, args) for bucket in buckets)
+    print(f"Total {'reclaimable' if args.dry_run else 'reclaimed'}: {human(total)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
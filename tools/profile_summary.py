@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Summarize the slow-render profiles written by PROFILE_MODE (see app.py).
+
+Collapsed-stack files (*.folded, PROFILE_MODE=sample) are merged into one
+flamegraph-ready file: feed it to flamegraph.pl or paste it into
+speedscope.app. cProfile files (*.pstats, PROFILE_MODE=cprofile) are combined
+and listed by self and cumulative time. Both kinds print the hottest functions.
+
+Windows PowerShell:
+    python .\\tools\\profile_summary.py
+    python .\\tools\\profile_summary.py --label generate --since 2h --folded-out slow.folded
+"""
+import argparse
+import io
+import os
+import pstats
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_DIR = os.environ.get('PROFILE_DIR', str(ROOT / 'profiles'))
+
+UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_age(text):
+    """'90s', '30m', '2h', '7d' (or plain seconds) -> seconds."""
+    text = text.strip().lower()
+    if text and text[-1] in UNITS:
+        return float(text[:-1]) * UNITS[text[-1]]
+    return float(text)
+
+
+def profile_label(name):
+    # <date>-<time>_<pid>_<id>_<label>_<ms>ms.<ext>; labels may contain underscores
+    stem = name.rsplit('.', 1)[0]
+    parts = stem.split('_')
+    return '_'.join(parts[3:-1])
+
+
+def find_profiles(directory, label=None, since=None):
+    if not os.path.isdir(directory):
+        return []
+    cutoff = time.time() - since if since else None
+    found = []
+    for entry in os.scandir(directory):
+        if not entry.name.endswith(('.folded', '.pstats')):
+            continue
+        if label and profile_label(entry.name) != label:
+            continue
+        if cutoff and entry.stat().st_mtime < cutoff:
+            continue
+        found.append(entry.path)
+    return sorted(found)
+
+
+def merge_folded(paths):
+    stacks = Counter()
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack and count.isdigit():
+                    stacks[stack] += int(count)
+    return stacks
+
+
+def hottest_frames(stacks, top):
+    """(self samples, total samples) per frame, hottest self time first."""
+    self_counts, total_counts = Counter(), Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(';')
+        self_counts[frames[-1]] += count
+        # A recursive frame counts once per stack
+        for frame in set(frames):
+            total_counts[frame] += count
+    return [(frame, n, total_counts[frame]) for frame, n in self_counts.most_common(top)]
+
+
+def summarize_folded(paths, top, out_path=None):
+    stacks = merge_folded(paths)
+    samples = sum(stacks.values())
+    print(f"{len(paths)} sampled profile(s), {samples} samples")
+    if not samples:
+        return
+    print(f"\n{'self %':>7} {'total %':>8}  frame")
+    for frame, self_n, total_n in hottest_frames(stacks, top):
+        print(f"{self_n / samples:7.1%} {total_n / samples:8.1%}  {frame}")
+    if out_path:
+        with open(out_path, 'w', encoding='utf-8') as f:
+            for stack, count in sorted(stacks.items()):
+                f.write(f"{stack} {count}\n")
+        print(f"\nMerged stacks written to {out_path} (flamegraph.pl {out_path} > flame.svg)")
+
+
+def summarize_pstats(paths, top, out_path=None):
+    print(f"{len(paths)} cProfile profile(s)")
+    stats = pstats.Stats(paths[0], stream=io.StringIO())
+    for path in paths[1:]:
+        stats.add(path)
+    if out_path:
+        stats.dump_stats(out_path)
+        print(f"Combined stats written to {out_path} (snakeviz {out_path})")
+    for key, title in (('tottime', 'self time'), ('cumulative', 'cumulative time')):
+        buf = io.StringIO()
+        stats.stream = buf
+        stats.sort_stats(key).print_stats(top)
+        print(f"\n--- Top {top} by {title} ---")
+        # Skip pstats' header lines up to the column titles
+        lines = buf.getvalue().splitlines()
+        start = next((i for i, line in enumerate(lines) if line.lstrip().startswith('ncalls')), 0)
+        print('\n'.join(line for line in lines[start:] if line.strip()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge slow-render profiles into a flamegraph-ready summary.")
+    parser.add_argument('--dir', default=DEFAULT_DIR, help="profile directory (default: PROFILE_DIR or ./profiles)")
+    parser.add_argument('--label', help="only profiles of this block, e.g. generate or generate_cover_image")
+    parser.add_argument('--since', type=parse_age, help="only profiles newer than this, e.g. 30m, 2h, 7d")
+    parser.add_argument('--top', type=int, default=25, help="functions to list (default: %(default)s)")
+    parser.add_argument('--folded-out', help="write the merged collapsed stacks here")
+    parser.add_argument('--pstats-out', help="write the combined cProfile stats here")
+    args = parser.parse_args()
+
+    paths = find_profiles(args.dir, args.label, args.since)
+    folded = [p for p in paths if p.endswith('.folded')]
+    stats = [p for p in paths if p.endswith('.pstats')]
+    if not paths:
+        print(f"No profiles in {args.dir}")
+        return 1
+    if folded:
+        summarize_folded(folded, args.top, args.folded_out)
+    if stats:
+        if folded:
+            print()
+        summarize_pstats(stats, args.top, args.pstats_out)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())